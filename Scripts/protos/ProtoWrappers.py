@@ -2,15 +2,15 @@
 
 import os
 import sys
-import subprocess
 import datetime
 import argparse
 import re
 
-
-git_repo_path = os.path.abspath(
-    subprocess.check_output(["git", "rev-parse", "--show-toplevel"], text=True).strip()
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sds_codegen")
 )
+import sds_common
+
 
 enum_item_regex = re.compile(r"^(.+?)\s*=\s*(\d+?)\s*;$")
 enum_regex = re.compile(r"^enum\s+(.+?)\s+\{$")
@@ -2351,8 +2351,7 @@ def process_proto_file(args, proto_file_path, dst_file_path):
     context.prepare()
     context.generate(writer)
     output = writer.join()
-    with open(dst_file_path, "wt") as f:
-        f.write(output)
+    sds_common.write_text_file_if_changed(dst_file_path, output)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import time
+import sds_common
+import sds_generate
+import sds_parse_objc
+
+# Micro-benchmarks for the SDS code generation scripts.
+#
+# These run against synthetic inputs, so they don't need clang,
+# sourcekitten or an iOS SDK. For example:
+#
+# Scripts/sds_codegen/sds_benchmark.py ast-reader
+# Scripts/sds_codegen/sds_benchmark.py clean-up-generated-code
+# Scripts/sds_codegen/sds_benchmark.py class-hierarchy
+
+
+def measure(block, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        block()
+        duration = time.perf_counter() - start
+        if best is None or duration < best:
+            best = duration
+    return best
+
+
+# --- AST Reader
+
+
+# The LineProcessor that process_objc_ast() used to use, which copied the
+# remaining lines on every pop.
+class ListSlicingLineProcessor:
+    def __init__(self, lines):
+        self.lines = [line.rstrip("\n") for line in lines]
+
+    def hasNext(self):
+        return len(self.lines) > 0
+
+    def next(self, should_pop=False):
+        if len(self.lines) == 0:
+            return None
+        line = self.lines[0]
+        if should_pop:
+            self.lines = self.lines[1:]
+        return line
+
+    def popNext(self):
+        return self.next(should_pop=True)
+
+
+# Builds a clang-style text AST with roughly line_count lines. Like real
+# dumps, most of it is SDK declarations that the parser skips.
+def synthetic_objc_ast(line_count):
+    lines = ["TranslationUnitDecl 0x1 <<invalid sloc>> <invalid sloc>\n"]
+    index = 0
+    while len(lines) < line_count:
+        index = index + 1
+        for sdk_index in range(20):
+            lines.append(
+                "|-TypedefDecl 0x%x </SDK/Foundation.h:%d:1, col:20> col:20 SDKType%d_%d 'int'\n"
+                % (index, sdk_index, index, sdk_index)
+            )
+            lines.append("| `-BuiltinType 0x2 'int'\n")
+        class_name = "Model%d" % index
+        lines.append(
+            "|-ObjCInterfaceDecl 0x10 </x/%s.h:14:1, line:25:2> line:14:12 %s\n"
+            % (class_name, class_name)
+        )
+        lines.append("| |-super ObjCInterface 0x11 'NSObject'\n")
+        for property_index in range(5):
+            lines.append(
+                "| |-ObjCPropertyDecl 0x14 <line:%d:1, col:43> col:43 property%d 'NSString * _Nullable':'NSString *' readonly nonatomic\n"
+                % (property_index, property_index)
+            )
+        lines.append(
+            "|-ObjCImplementationDecl 0x30 <line:24:1, line:87:1> line:24:17 %s\n"
+            % (class_name,)
+        )
+        for property_index in range(5):
+            lines.append(
+                "| |-ObjCPropertyImplDecl 0x32 <<invalid sloc>, col:53> <invalid sloc> property%d synthesize\n"
+                % (property_index,)
+            )
+    return lines
+
+
+def parse_objc_ast(ast_lines, line_processor_class):
+    original_line_processor_class = sds_parse_objc.LineProcessor
+    sds_parse_objc.LineProcessor = line_processor_class
+    try:
+        namespace = sds_parse_objc.Namespace()
+        sds_parse_objc.process_objc_ast(namespace, "Benchmark.m", iter(ast_lines))
+    finally:
+        sds_parse_objc.LineProcessor = original_line_processor_class
+
+
+def benchmark_ast_reader(args):
+    print("%10s %10s %12s %12s" % ("lines", "MB", "slicing (s)", "stream (s)"))
+    for line_count in args.line_counts:
+        ast_lines = synthetic_objc_ast(line_count)
+        megabytes = sum(len(line) for line in ast_lines) / (1024 * 1024)
+        slicing_duration = measure(
+            lambda: parse_objc_ast(ast_lines, ListSlicingLineProcessor), repeat=1
+        )
+        stream_duration = measure(
+            lambda: parse_objc_ast(ast_lines, sds_parse_objc.LineProcessor)
+        )
+        print(
+            "%10d %10.1f %12.3f %12.3f"
+            % (len(ast_lines), megabytes, slicing_duration, stream_duration)
+        )
+
+
+# --- Clean Up Generated Code
+
+
+# The clean_up_generated_code() that sds_common used to use, which
+# rescanned the whole text for every round of newline compaction.
+def repeated_replace_clean_up_generated_code(text):
+    lines = text.split("\n")
+    lines = [line.rstrip() for line in lines]
+    text = "\n".join(lines)
+    while "\n\n\n" in text:
+        text = text.replace("\n\n\n", "\n\n")
+    return text.strip() + "\n"
+
+
+def find_generated_swift_file_paths(dir_path):
+    file_paths = []
+    for rootdir, dirnames, filenames in os.walk(dir_path):
+        for filename in filenames:
+            if filename.endswith("+SDS.swift"):
+                file_paths.append(os.path.join(rootdir, filename))
+    return sorted(file_paths)
+
+
+# The generated files have already been cleaned up. Before clean up, the
+# generator's output has trailing whitespace and runs of blank lines
+# where its templates were joined, so we approximate that.
+def uncleaned_generated_code(text):
+    text = text.replace("{\n", "{    \n")
+    text = text.replace("\n\n", "\n    \n\n\t\n\n")
+    return "\n\n    " + text + "\n\n\n    "
+
+
+def benchmark_clean_up_generated_code(args):
+    dir_path = os.path.join(sds_common.repo_root(), "SignalServiceKit")
+    file_paths = find_generated_swift_file_paths(dir_path)
+    texts = []
+    for file_path in file_paths:
+        with open(file_path, "rt") as f:
+            texts.append(f.read())
+    inputs = (
+        ("generated", texts),
+        ("uncleaned", [uncleaned_generated_code(text) for text in texts]),
+    )
+
+    print(
+        "%d generated files, %.1f MB"
+        % (len(texts), sum(len(text) for text in texts) / (1024 * 1024))
+    )
+    print("%10s %12s %12s" % ("input", "replace (s)", "single (s)"))
+    for name, input_texts in inputs:
+        for text in input_texts:
+            expected_text = repeated_replace_clean_up_generated_code(text)
+            if sds_common.clean_up_generated_code(text) != expected_text:
+                raise Exception("Mismatched output")
+
+        def clean_up_all(clean_up):
+            for text in input_texts:
+                clean_up(text)
+
+        replace_duration = measure(
+            lambda: clean_up_all(repeated_replace_clean_up_generated_code),
+            repeat=args.repeat,
+        )
+        single_duration = measure(
+            lambda: clean_up_all(sds_common.clean_up_generated_code),
+            repeat=args.repeat,
+        )
+        print("%10s %12.4f %12.4f" % (name, replace_duration, single_duration))
+
+
+# --- Class Hierarchy
+
+
+# The ParsedClass methods and all_descendents_of_class() that sds_generate
+# used to use, which walked global_class_map on every call.
+def walking_is_sds_model(clazz):
+    if clazz.super_class_name is None:
+        return False
+    if not clazz.super_class_name in sds_generate.global_class_map:
+        return False
+    if clazz.super_class_name in (
+        sds_generate.OLD_BASE_MODEL_CLASS_NAME,
+        sds_generate.NEW_BASE_MODEL_CLASS_NAME,
+    ):
+        return True
+    super_class = sds_generate.global_class_map[clazz.super_class_name]
+    return walking_is_sds_model(super_class)
+
+
+def walking_table_superclass(clazz):
+    if clazz.super_class_name is None:
+        return clazz
+    if not clazz.super_class_name in sds_generate.global_class_map:
+        return clazz
+    if clazz.super_class_name == sds_generate.OLD_BASE_MODEL_CLASS_NAME:
+        return clazz
+    if clazz.super_class_name == sds_generate.NEW_BASE_MODEL_CLASS_NAME:
+        return clazz
+    super_class = sds_generate.global_class_map[clazz.super_class_name]
+    return walking_table_superclass(super_class)
+
+
+def walking_all_superclass_names(clazz):
+    result = [clazz.name]
+    if clazz.super_class_name is not None:
+        if clazz.super_class_name in sds_generate.global_class_map:
+            super_class = sds_generate.global_class_map[clazz.super_class_name]
+            result += walking_all_superclass_names(super_class)
+    return result
+
+
+def walking_all_descendents_of_class(clazz):
+    result = []
+
+    subclasses = sds_generate.global_subclass_map.get(clazz.name, [])
+    subclasses.sort(key=lambda value: value.name)
+    for subclass in subclasses:
+        result.append(subclass)
+        result.extend(walking_all_descendents_of_class(subclass))
+
+    return result
+
+
+# Builds a hierarchy of `width` model tables, each a chain of `depth`
+# subclasses under a table class, under the base model class.
+def synthetic_class_dicts(depth, width):
+    class_dicts = [
+        {
+            "name": sds_generate.OLD_BASE_MODEL_CLASS_NAME,
+            "super_class_name": "NSObject",
+            "filepath": "Benchmark.m",
+            "properties": [],
+        }
+    ]
+    for table_index in range(width):
+        super_class_name = sds_generate.OLD_BASE_MODEL_CLASS_NAME
+        for depth_index in range(depth):
+            class_name = "Model%d_%d" % (table_index, depth_index)
+            class_dicts.append(
+                {
+                    "name": class_name,
+                    "super_class_name": super_class_name,
+                    "filepath": "Benchmark.m",
+                    "properties": [],
+                }
+            )
+            super_class_name = class_name
+    return class_dicts
+
+
+def load_class_hierarchy(class_dicts):
+    sds_generate.global_class_map.clear()
+    sds_generate.global_subclass_map.clear()
+    for class_dict in class_dicts:
+        clazz = sds_generate.ParsedClass(class_dict)
+        sds_generate.global_class_map[clazz.name] = clazz
+    sds_generate.update_subclass_map()
+    sds_generate.update_class_hierarchy()
+
+
+# Like generation, queries the hierarchy for every class.
+def query_class_hierarchy(
+    is_sds_model, table_superclass, all_superclass_names, all_descendents_of_class
+):
+    result = []
+    for clazz in sds_generate.global_class_map.values():
+        result.append(
+            (
+                is_sds_model(clazz),
+                table_superclass(clazz).name,
+                list(all_superclass_names(clazz)),
+                [descendant.name for descendant in all_descendents_of_class(clazz)],
+            )
+        )
+    return result
+
+
+def benchmark_class_hierarchy(args):
+    walking_queries = (
+        walking_is_sds_model,
+        walking_table_superclass,
+        walking_all_superclass_names,
+        walking_all_descendents_of_class,
+    )
+    index_queries = (
+        sds_generate.ParsedClass.is_sds_model,
+        sds_generate.ParsedClass.table_superclass,
+        sds_generate.ParsedClass.all_superclass_names,
+        sds_generate.all_descendents_of_class,
+    )
+
+    print(
+        "%8s %8s %8s %12s %12s %12s"
+        % ("depth", "width", "classes", "build (s)", "walk (s)", "index (s)")
+    )
+    for depth in args.depths:
+        class_dicts = synthetic_class_dicts(depth, args.width)
+        build_duration = measure(lambda: load_class_hierarchy(class_dicts))
+        if query_class_hierarchy(*walking_queries) != query_class_hierarchy(
+            *index_queries
+        ):
+            raise Exception("Mismatched output")
+
+        walk_duration = measure(
+            lambda: query_class_hierarchy(*walking_queries), repeat=1
+        )
+        index_duration = measure(lambda: query_class_hierarchy(*index_queries))
+        print(
+            "%8d %8d %8d %12.4f %12.4f %12.4f"
+            % (
+                depth,
+                args.width,
+                len(class_dicts),
+                build_duration,
+                walk_duration,
+                index_duration,
+            )
+        )
+
+
+# ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark SDS code generation.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    ast_reader_parser = subparsers.add_parser(
+        "ast-reader", help="process_objc_ast() line reader on a large AST."
+    )
+    ast_reader_parser.add_argument(
+        "--line-counts",
+        type=int,
+        nargs="+",
+        default=[10000, 20000, 40000],
+        help="sizes of the synthetic ASTs, in lines.",
+    )
+    ast_reader_parser.set_defaults(run=benchmark_ast_reader)
+
+    clean_up_parser = subparsers.add_parser(
+        "clean-up-generated-code",
+        help="clean_up_generated_code() on the generated +SDS.swift files.",
+    )
+    clean_up_parser.add_argument(
+        "--repeat",
+        type=int,
+        default=10,
+        help="number of times to measure each implementation.",
+    )
+    clean_up_parser.set_defaults(run=benchmark_clean_up_generated_code)
+
+    class_hierarchy_parser = subparsers.add_parser(
+        "class-hierarchy",
+        help="class hierarchy queries on a synthetic deep hierarchy.",
+    )
+    class_hierarchy_parser.add_argument(
+        "--depths",
+        type=int,
+        nargs="+",
+        default=[10, 50, 200],
+        help="depths of the synthetic class hierarchies.",
+    )
+    class_hierarchy_parser.add_argument(
+        "--width",
+        type=int,
+        default=10,
+        help="number of model tables in the synthetic class hierarchies.",
+    )
+    class_hierarchy_parser.set_defaults(run=benchmark_class_hierarchy)
+
+    args = parser.parse_args()
+    args.run(args)
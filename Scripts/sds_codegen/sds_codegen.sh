@@ -2,17 +2,29 @@
 
 set -eux
 
+# Set SDS_TIMING_REPORT_DIR to record a timing report.
+#
+# Any arguments are passed on to sds_pipeline.py, e.g. --write-sdsjson to
+# keep the parsed classes for sds_regenerate.sh.
+
 # When parsing Obj-c source files, we need to be able to import type
 # definitions for all types we use, otherwise clang will treat them
 # as `long *`.
 #
-# This script enumerates all swift files in our codebase (including our Pods)
-# and generates fake Obj-c headers (.h) that @interface and @protocol
+# So we first enumerate all swift files in our codebase (including our Pods)
+# and generate fake Obj-c headers (.h) that @interface and @protocol
 # stubs for each swift class.  This is analogous to a very simplified
 # version of the "-Swift.h" files used by Swift for bridging.
-Scripts/sds_codegen/sds_parse_swift_bridging.py --src-path  . --swift-bridging-path Scripts/sds_codegen/sds-includes
-
-# We parse Obj-C source files (.m only, not .mm yet) to extract simple class descriptions (class name, base class, property names and types, etc.)
-Scripts/sds_codegen/sds_parse_objc.py --src-path SignalServiceKit/ --swift-bridging-path Scripts/sds_codegen/sds-includes
-
-Scripts/sds_codegen/sds_regenerate.sh
+#
+# We then parse Obj-C source files (.m only, not .mm yet) to extract simple class descriptions (class name, base class, property names and types, etc.)
+#
+# Finally, we generate Swift extensions to handle serialization, etc. for models.
+#
+# sds_pipeline.py does all three in one process. See sds_regenerate.sh for
+# the arguments of the last step.
+RECORD_TYPE_SWIFT="SignalServiceKit/Storage/Database/SDSRecordType.swift"
+RECORD_TYPE_JSON="Scripts/sds_codegen/sds_config/sds_record_type_map.json"
+CONFIG_JSON="Scripts/sds_codegen/sds_config/sds-config.json"
+PROPERTY_ORDER_JSON="Scripts/sds_codegen/sds_config/sds-property_order.json"
+GENERATE_ARGS="--record-type-swift-path $RECORD_TYPE_SWIFT  --record-type-json-path $RECORD_TYPE_JSON --config-json-path $CONFIG_JSON --property-order-json-path $PROPERTY_ORDER_JSON"
+Scripts/sds_codegen/sds_pipeline.py --swift-src-path . --src-path SignalServiceKit/ --swift-bridging-path Scripts/sds_codegen/sds-includes --jobs `sysctl -n hw.ncpu` --cache-dir Scripts/sds_codegen/sds-cache $GENERATE_ARGS ${SDS_TIMING_REPORT_DIR:+--timing-report $SDS_TIMING_REPORT_DIR/sds_pipeline.json} "$@"
@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import subprocess
+import contextlib
+import datetime
+import hashlib
+import json
+import tempfile
+import time
 
 SDS_JSON_FILE_EXTENSION = ".sdsjson"
 
@@ -11,13 +18,61 @@ def fail(*args):
     raise Exception(error)
 
 
-git_repo_path = os.path.abspath(
-    subprocess.check_output(["git", "rev-parse", "--show-toplevel"], text=True).strip()
-)
+# The repo's root dir is resolved lazily, so that scripts don't pay for it
+# before they need it (e.g. for --help), nor do worker processes that
+# merely import this module.
+#
+# It can be set with set_repo_root() or SDS_REPO_ROOT. Otherwise, it's
+# the nearest dir containing .git, starting from the current dir, as with
+# `git rev-parse --show-toplevel`.
+REPO_ROOT_ENV_VAR = "SDS_REPO_ROOT"
+
+repo_root_path = None
+
+
+def repo_root():
+    global repo_root_path
+    if repo_root_path is None:
+        repo_root_path = find_repo_root()
+    return repo_root_path
+
+
+def set_repo_root(path):
+    global repo_root_path
+    repo_root_path = os.path.abspath(path)
+    # Pass it on to worker processes.
+    os.environ[REPO_ROOT_ENV_VAR] = repo_root_path
+
+
+def find_repo_root():
+    path = os.environ.get(REPO_ROOT_ENV_VAR)
+    if path:
+        return os.path.abspath(path)
+
+    path = os.getcwd()
+    while True:
+        # .git is a file in worktrees and submodules.
+        if os.path.exists(os.path.join(path, ".git")):
+            return path
+        parent_path = os.path.dirname(path)
+        if parent_path == path:
+            break
+        path = parent_path
+
+    try:
+        output = subprocess.check_output(
+            ["git", "rev-parse", "--show-toplevel"],
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        fail("Could not find the repo's root dir; set %s." % REPO_ROOT_ENV_VAR)
+    return os.path.abspath(output.strip())
 
 
 def sds_to_relative_path(path):
     path = os.path.abspath(path)
+    git_repo_path = repo_root()
     if not path.startswith(git_repo_path):
         fail("Unexpected path:", path)
     path = path[len(git_repo_path) :]
@@ -27,19 +82,32 @@ def sds_to_relative_path(path):
 
 
 def sds_from_relative_path(path):
-    return os.path.join(git_repo_path, path)
+    return os.path.join(repo_root(), path)
 
 
+# Removes trailing whitespace, compacts runs of blank lines into one and
+# strips leading and trailing whitespace, in a single pass over the lines.
 def clean_up_generated_code(text):
-    # Remove trailing whitespace.
-    lines = text.split("\n")
-    lines = [line.rstrip() for line in lines]
-    text = "\n".join(lines)
-    # Compact newlines.
-    while "\n\n\n" in text:
-        text = text.replace("\n\n\n", "\n\n")
+    lines = []
+    # Leading blank lines are dropped.
+    is_previous_line_blank = True
+    for line in text.split("\n"):
+        # Remove trailing whitespace.
+        line = line.rstrip()
+        # Compact newlines.
+        if len(line) == 0:
+            if is_previous_line_blank:
+                continue
+            is_previous_line_blank = True
+        else:
+            is_previous_line_blank = False
+        lines.append(line)
+    if len(lines) > 0:
+        if len(lines[-1]) == 0:
+            lines.pop()
+        lines[0] = lines[0].lstrip()
     # Ensure there's a trailing newline.
-    return text.strip() + "\n"
+    return "\n".join(lines) + "\n"
 
 
 def clean_up_generated_swift(text):
@@ -52,17 +120,382 @@ def clean_up_generated_objc(text):
 
 def pretty_module_path(path):
     path = os.path.abspath(path)
+    git_repo_path = repo_root()
     if path.startswith(git_repo_path):
         path = path[len(git_repo_path) :]
     return path
 
 
+def file_digest(file_path):
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# A digest of the paths and contents of every file in a directory tree.
+def directory_digest(dir_path):
+    hasher = hashlib.sha256()
+    if os.path.isdir(dir_path):
+        for rootdir, dirnames, filenames in os.walk(dir_path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                file_path = os.path.join(rootdir, filename)
+                hasher.update(os.path.relpath(file_path, dir_path).encode("utf-8"))
+                hasher.update(file_digest(file_path).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+# --- Writing Files
+
+# Generated files are written to a temporary file in the same directory
+# and then renamed over the destination, so that an interrupted run can't
+# leave a half-written file behind (which forces a full rebuild in Xcode).
+#
+# Unchanged files aren't rewritten, so that their mtimes are preserved.
+# Rather than reading each existing file in full, we compare sizes first
+# and only then stream its contents.
+#
+# Inside batched_writes(), writes are staged in memory and only committed
+# when the block completes, so that a run which fails part way through
+# leaves all of its outputs untouched.
+
+FILE_COMPARE_CHUNK_SIZE = 1024 * 1024
+
+# The paths and contents of the writes staged by batched_writes(), or None
+# if writes aren't being batched.
+pending_writes = None
+
+
+def is_file_content_equal(file_path, data):
+    try:
+        if os.stat(file_path).st_size != len(data):
+            return False
+        with open(file_path, "rb") as f:
+            view = memoryview(data)
+            offset = 0
+            while offset < len(data):
+                chunk = f.read(FILE_COMPARE_CHUNK_SIZE)
+                if not chunk or view[offset : offset + len(chunk)] != chunk:
+                    return False
+                offset = offset + len(chunk)
+            return True
+    except FileNotFoundError:
+        return False
+
+
+# The mode of newly created files, from the umask.
+file_mode = None
+
+
+def default_file_mode():
+    global file_mode
+    if file_mode is None:
+        umask = os.umask(0)
+        os.umask(umask)
+        file_mode = 0o666 & ~umask
+    return file_mode
+
+
+def write_file_atomically(file_path, data):
+    dir_path, filename = os.path.split(os.path.abspath(file_path))
+    try:
+        mode = os.stat(file_path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = default_file_mode()
+    fd, temp_file_path = tempfile.mkstemp(
+        dir=dir_path, prefix="." + filename + ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(temp_file_path, mode)
+        os.replace(temp_file_path, file_path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_file_path)
+        raise
+
+
+# Returns True if the file was (or, inside batched_writes(), will be)
+# written.
+def write_file_if_changed(file_path, data):
+    if pending_writes is not None:
+        file_path = os.path.abspath(file_path)
+        if file_path in pending_writes:
+            is_changed = pending_writes[file_path] != data
+        else:
+            is_changed = not is_file_content_equal(file_path, data)
+        pending_writes[file_path] = data
+        return is_changed
+
+    if is_file_content_equal(file_path, data):
+        return False
+    write_file_atomically(file_path, data)
+    return True
+
+
 def write_text_file_if_changed(file_path, text):
-    if os.path.exists(file_path):
-        with open(file_path, "rt") as f:
-            oldText = f.read()
-            if oldText == text:
-                return
-
-    with open(file_path, "wt") as f:
-        f.write(text)
+    return write_file_if_changed(file_path, text.encode("utf-8"))
+
+
+# Reads a file, including any write to it that batched_writes() has staged.
+def read_text_file(file_path):
+    if pending_writes is not None:
+        data = pending_writes.get(os.path.abspath(file_path))
+        if data is not None:
+            return data.decode("utf-8")
+    with open(file_path, "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+@contextlib.contextmanager
+def batched_writes():
+    global pending_writes
+    if pending_writes is not None:
+        # Nested batches are committed with the outermost one.
+        yield
+        return
+
+    pending_writes = {}
+    try:
+        yield
+        writes = pending_writes
+    finally:
+        pending_writes = None
+
+    for file_path, data in writes.items():
+        if not is_file_content_equal(file_path, data):
+            write_file_atomically(file_path, data)
+
+
+# Stages writes like batched_writes(), but yields them to the caller rather
+# than committing them, e.g. so that a worker process can hand them back to
+# the parent's batch.
+@contextlib.contextmanager
+def collected_writes():
+    global pending_writes
+    outer_pending_writes = pending_writes
+    pending_writes = {}
+    try:
+        yield pending_writes
+    finally:
+        pending_writes = outer_pending_writes
+
+
+# --- .sdsjson Manifest
+
+# sds_parse_objc.py lists the .sdsjson files it writes in a manifest in
+# its cache dir, so that sds_generate.py can find them without walking
+# the whole repo.
+#
+# sds_parse_objc.py can also be run without a cache dir, in which case it
+# rewrites .sdsjson files without updating the manifest. So the manifest
+# also records the subdirs and .sdsjson files of each dir that was parsed,
+# and it's out of date if any of them have since changed.
+
+SDS_JSON_MANIFEST_FILENAME = "sdsjson-manifest.json"
+SDS_JSON_MANIFEST_VERSION = 2
+
+
+def sds_json_manifest_path(cache_dir_path):
+    return os.path.join(cache_dir_path, SDS_JSON_MANIFEST_FILENAME)
+
+
+# The subdirs (with a trailing /) and .sdsjson files in a dir, sorted.
+def sds_json_dir_entries(dir_path):
+    entries = []
+    with os.scandir(dir_path) as dir_entries:
+        for entry in dir_entries:
+            if entry.is_dir():
+                entries.append(entry.name + "/")
+            elif entry.name.endswith(SDS_JSON_FILE_EXTENSION):
+                entries.append(entry.name)
+    return sorted(entries)
+
+
+# Returns the absolute paths of the .sdsjson files and of the dirs in the
+# manifest, or None if there's no manifest or it's out of date, e.g. after
+# `make clean`.
+def load_sds_json_manifest(cache_dir_path):
+    manifest_path = sds_json_manifest_path(cache_dir_path)
+    try:
+        with open(manifest_path, "rt") as f:
+            json_data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if json_data.get("version") != SDS_JSON_MANIFEST_VERSION:
+        return None
+    file_paths = [sds_from_relative_path(file_path) for file_path in json_data["files"]]
+    for file_path in file_paths:
+        if not os.path.isfile(file_path):
+            return None
+    dir_paths = []
+    for dir_path, entries in json_data["dirs"].items():
+        dir_path = sds_from_relative_path(dir_path)
+        try:
+            if sds_json_dir_entries(dir_path) != entries:
+                return None
+        except OSError:
+            return None
+        dir_paths.append(dir_path)
+    return file_paths, dir_paths
+
+
+def read_sds_json_manifest(cache_dir_path):
+    manifest = load_sds_json_manifest(cache_dir_path)
+    if manifest is None:
+        return None
+    file_paths, _ = manifest
+    return file_paths
+
+
+def delete_sds_json_manifest(cache_dir_path):
+    try:
+        os.remove(sds_json_manifest_path(cache_dir_path))
+    except FileNotFoundError:
+        pass
+
+
+def write_sds_json_manifest(cache_dir_path, file_paths, dir_paths):
+    json_data = {
+        "version": SDS_JSON_MANIFEST_VERSION,
+        "files": [sds_to_relative_path(file_path) for file_path in file_paths],
+        "dirs": {
+            sds_to_relative_path(dir_path): sds_json_dir_entries(dir_path)
+            for dir_path in sorted(dir_paths)
+        },
+    }
+    write_text_file_if_changed(
+        sds_json_manifest_path(cache_dir_path),
+        json.dumps(json_data, indent=2) + "\n",
+    )
+
+
+# --- Timing
+
+TIMING_REPORT_VERSION = 1
+TIMING_REPORT_SLOWEST_FILE_COUNT = 10
+
+
+# Opt-in instrumentation, enabled by each script's --timing-report option.
+#
+# Records the duration of each stage of a run, and numeric metrics for
+# each file. Metrics recorded more than once for a file are summed. By
+# convention:
+#
+# * seconds: the wall time spent on the file.
+# * subprocess_seconds: the wall time of clang or sourcekitten.
+# * ast_bytes: the size of the AST (or .sdsjson) that was parsed.
+# * parse_seconds: the time spent parsing the AST in Python.
+# * class_count, property_count: what the file declared.
+#
+# The report is written as JSON, and the slowest files are summarized on
+# stderr.
+class TimingReport:
+    def __init__(self, script_name, report_path):
+        self.script_name = script_name
+        self.report_path = report_path
+        self.enabled = report_path is not None
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self.start_time = time.perf_counter()
+        self.stage_seconds = {}
+        self.stage_names = []
+        self.file_metrics = {}
+
+    # Stages can be nested, e.g. when sds_pipeline.py runs the other
+    # scripts, in which case they're recorded as "outer/inner".
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.stage_names.append(name)
+        name = "/".join(self.stage_names)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start_time
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0) + duration
+            self.stage_names.pop()
+
+    def add_file_metrics(self, file_path, metrics):
+        if not self.enabled:
+            return
+        file_metrics = self.file_metrics.setdefault(sds_to_relative_path(file_path), {})
+        for key, value in metrics.items():
+            file_metrics[key] = file_metrics.get(key, 0) + value
+
+    def finish(self):
+        if not self.enabled:
+            return
+
+        total_seconds = time.perf_counter() - self.start_time
+        metric_totals = {}
+        for metrics in self.file_metrics.values():
+            for key, value in metrics.items():
+                metric_totals[key] = metric_totals.get(key, 0) + value
+
+        json_data = {
+            "version": TIMING_REPORT_VERSION,
+            "script": self.script_name,
+            "started_at": self.started_at.isoformat(),
+            "git_commit": git_commit(),
+            "seconds": total_seconds,
+            "stages": self.stage_seconds,
+            "totals": metric_totals,
+            "files": self.file_metrics,
+        }
+        report_path = os.path.abspath(self.report_path)
+        os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        with open(report_path, "wt") as f:
+            json.dump(json_data, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+        self.print_summary(total_seconds)
+
+    def print_summary(self, total_seconds):
+        def log(*args):
+            print(*args, file=sys.stderr)
+
+        log(f"{self.script_name}: {total_seconds:.2f}s")
+        for name, seconds in self.stage_seconds.items():
+            log(f"  {seconds:8.2f}s  {name}")
+
+        # Files whose results were cached aren't timed.
+        timed_file_paths = [
+            file_path
+            for file_path, metrics in self.file_metrics.items()
+            if "seconds" in metrics
+        ]
+        slowest_file_paths = sorted(
+            timed_file_paths,
+            key=lambda file_path: self.file_metrics[file_path]["seconds"],
+            reverse=True,
+        )[:TIMING_REPORT_SLOWEST_FILE_COUNT]
+        if len(slowest_file_paths) == 0:
+            return
+        log(f"Slowest {len(slowest_file_paths)} / {len(timed_file_paths)} files:")
+        for file_path in slowest_file_paths:
+            metrics = self.file_metrics[file_path]
+            details = []
+            if "subprocess_seconds" in metrics:
+                details.append(f"subprocess {metrics['subprocess_seconds']:.2f}s")
+            if "parse_seconds" in metrics:
+                details.append(f"parse {metrics['parse_seconds']:.2f}s")
+            if "generate_seconds" in metrics:
+                details.append(f"generate {metrics['generate_seconds']:.2f}s")
+            if "ast_bytes" in metrics:
+                details.append(f"{metrics['ast_bytes'] / (1024 * 1024):.1f} MB")
+            log(f"  {metrics['seconds']:8.2f}s  {file_path} ({', '.join(details)})")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=repo_root(),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except subprocess.CalledProcessError:
+        return None
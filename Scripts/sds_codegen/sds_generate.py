@@ -7,7 +7,8 @@ import re
 import json
 import sds_common
 from sds_common import fail
-import random
+import time
+import concurrent.futures
 
 # TODO: We should probably generate a class that knows how to set up
 #       the database.  It would:
@@ -40,8 +41,8 @@ def update_generated_snippet(file_path, marker, snippet):
     if not os.path.exists(file_path):
         fail("Missing file:", file_path)
 
-    with open(file_path, "rt") as f:
-        text = f.read()
+    # A file can contain several classes, so read any update we've staged.
+    text = sds_common.read_text_file(file_path)
 
     start_index = text.find(marker)
     end_index = text.rfind(marker)
@@ -83,7 +84,10 @@ def update_objc_snippet(file_path, snippet):
 
 global_class_map = {}
 global_subclass_map = {}
-global_args = None
+# The path of the config JSON, for suggestions in errors.
+global_config_json_path = None
+# Enabled with --timing-report.
+timing = sds_common.TimingReport("sds_generate", None)
 
 # ----
 
@@ -93,6 +97,14 @@ def to_swift_identifier_name(identifier_name):
 
 
 class ParsedClass:
+    __slots__ = (
+        "name",
+        "super_class_name",
+        "filepath",
+        "finalize_method_name",
+        "property_map",
+    )
+
     def __init__(self, json_dict):
         self.name = json_dict.get("name")
         self.super_class_name = json_dict.get("super_class_name")
@@ -194,17 +206,7 @@ class ParsedClass:
         return None
 
     def is_sds_model(self):
-        if self.super_class_name is None:
-            return False
-        if not self.super_class_name in global_class_map:
-            return False
-        if self.super_class_name in (
-            OLD_BASE_MODEL_CLASS_NAME,
-            NEW_BASE_MODEL_CLASS_NAME,
-        ):
-            return True
-        super_class = global_class_map[self.super_class_name]
-        return super_class.is_sds_model()
+        return global_class_hierarchy.is_sds_model(self)
 
     def has_sds_superclass(self):
         return (
@@ -215,27 +217,13 @@ class ParsedClass:
         )
 
     def table_superclass(self):
-        if self.super_class_name is None:
-            return self
-        if not self.super_class_name in global_class_map:
-            return self
-        if self.super_class_name == OLD_BASE_MODEL_CLASS_NAME:
-            return self
-        if self.super_class_name == NEW_BASE_MODEL_CLASS_NAME:
-            return self
-        super_class = global_class_map[self.super_class_name]
-        return super_class.table_superclass()
+        return global_class_hierarchy.table_superclass(self)
 
     def all_superclass_names(self):
-        result = [self.name]
-        if self.super_class_name is not None:
-            if self.super_class_name in global_class_map:
-                super_class = global_class_map[self.super_class_name]
-                result += super_class.all_superclass_names()
-        return result
+        return list(global_class_hierarchy.superclass_names(self))
 
     def has_any_superclass_with_name(self, name):
-        return name in self.all_superclass_names()
+        return name in global_class_hierarchy.superclass_names(self)
 
     def should_generate_extensions(self):
         if self.name in (
@@ -345,6 +333,16 @@ class ParsedClass:
 
 
 class TypeInfo:
+    __slots__ = (
+        "_swift_type",
+        "_objc_type",
+        "should_use_blob",
+        "is_codable",
+        "is_enum",
+        "field_override_column_type",
+        "field_override_record_swift_type",
+    )
+
     def __init__(
         self,
         swift_type,
@@ -698,12 +696,26 @@ class TypeInfo:
 
 
 class ParsedProperty:
+    __slots__ = (
+        "name",
+        "is_optional",
+        "objc_type",
+        "class_name",
+        "swift_type",
+        "force_optional",
+        "property_order",
+        "_type_info",
+        "_objc_type_safe",
+    )
+
     def __init__(self, json_dict):
         self.name = json_dict.get("name")
         self.is_optional = json_dict.get("is_optional")
         self.objc_type = json_dict.get("objc_type")
         self.class_name = json_dict.get("class_name")
         self.swift_type = None
+        self._type_info = None
+        self._objc_type_safe = None
 
     def try_to_convert_objc_primitive_to_swift(self, objc_type, unpack_nsnumber=True):
         if objc_type is None:
@@ -911,17 +923,19 @@ class ParsedProperty:
         return self._field_override("objc_initializer_type")
 
     def _field_override(self, override_field):
-        manually_typed_fields = configuration_json.get("manually_typed_fields")
-        if manually_typed_fields is None:
-            fail("Configuration JSON is missing manually_typed_fields")
-        key = self.class_name + "." + self.name
-
-        if key in manually_typed_fields:
-            return manually_typed_fields[key][override_field]
-        else:
+        field_overrides = property_config(self).field_overrides
+        if field_overrides is None:
             return None
+        return field_overrides[override_field]
 
+    # A property's type only depends on the config and enum_type_map, which
+    # are loaded before any models are generated, so we resolve it once.
     def type_info(self):
+        if self._type_info is None:
+            self._type_info = self.resolve_type_info()
+        return self._type_info
+
+    def resolve_type_info(self):
         if self.swift_type is not None:
             should_use_blob = (
                 self.swift_type.startswith("[")
@@ -942,6 +956,11 @@ class ParsedProperty:
         return self.type_info().swift_type()
 
     def objc_type_safe(self):
+        if self._objc_type_safe is None:
+            self._objc_type_safe = self.resolve_objc_type_safe()
+        return self._objc_type_safe
+
+    def resolve_objc_type_safe(self):
         if self.field_override_objc_initializer_type() is not None:
             return self.field_override_objc_initializer_type()
 
@@ -2523,19 +2542,102 @@ public extension %(model_name)s {
             "record_name": clazz.record_name(),
         }
 
-    print(f"Writing {swift_filename}")
-
+    # The output is deterministic, so that unchanged models aren't rewritten
+    # (and recompiled). To lint the generated files, pass them to
+    # Scripts/precommit.py.
     swift_body = sds_common.clean_up_generated_swift(swift_body)
 
-    # Add some random whitespace to trigger the auto-formatter.
-    swift_body = swift_body + (" " * random.randint(1, 100))
+    if sds_common.write_text_file_if_changed(swift_filepath, swift_body):
+        print(f"Writing {swift_filename}")
 
-    sds_common.write_text_file_if_changed(swift_filepath, swift_body)
 
+def add_generate_metrics(clazz, seconds):
+    if timing.enabled:
+        # Attributed to the .sdsjson file the class was parsed from.
+        timing.add_file_metrics(
+            clazz.filepath + sds_common.SDS_JSON_FILE_EXTENSION,
+            {
+                "seconds": seconds,
+                "generate_seconds": seconds,
+            },
+        )
+
+
+def process_class_map(class_map, jobs):
+    if jobs > 1:
+        process_class_map_in_parallel(class_map, jobs)
+        return
 
-def process_class_map(class_map):
     for clazz in class_map.values():
+        start_time = time.perf_counter()
+        generate_swift_extensions_for_model(clazz)
+        add_generate_metrics(clazz, time.perf_counter() - start_time)
+
+
+# ---- Parallel Generation
+
+# Each model is generated in a worker process, which hands back the files
+# it would write and the property orders it assigned. The parent applies
+# them in class order, so the result is the same as a serial run.
+#
+# Models of the same record assign the same orders to new properties, so
+# workers can't disagree about them.
+
+
+def generation_state():
+    return (
+        global_class_map,
+        global_subclass_map,
+        global_class_hierarchy,
+        configuration,
+        property_order_json,
+        record_type_map,
+        enum_type_map,
+        global_config_json_path,
+    )
+
+
+def init_generate_worker(state):
+    global global_class_map, global_subclass_map, global_class_hierarchy
+    global configuration, property_order_json, record_type_map
+    global enum_type_map, global_config_json_path
+    (
+        global_class_map,
+        global_subclass_map,
+        global_class_hierarchy,
+        configuration,
+        property_order_json,
+        record_type_map,
+        enum_type_map,
+        global_config_json_path,
+    ) = state
+
+
+def generate_model_job(clazz):
+    assigned_property_orders.clear()
+    start_time = time.perf_counter()
+    with sds_common.collected_writes() as writes:
         generate_swift_extensions_for_model(clazz)
+    seconds = time.perf_counter() - start_time
+    return writes, dict(assigned_property_orders), seconds
+
+
+def process_class_map_in_parallel(class_map, jobs):
+    classes = list(class_map.values())
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=init_generate_worker,
+        initargs=(generation_state(),),
+    ) as executor:
+        job_results = executor.map(generate_model_job, classes)
+        for clazz, (writes, property_orders, seconds) in zip(classes, job_results):
+            for file_path, data in writes.items():
+                sds_common.write_file_if_changed(file_path, data)
+            for key, value in property_orders.items():
+                if property_order_json.get(key, value) != value:
+                    fail("Conflicting property order:", key)
+                property_order_json[key] = value
+            add_generate_metrics(clazz, seconds)
 
 
 # ---- Record Type Map
@@ -2692,19 +2794,46 @@ def swift_type_for_enum(enum_name):
         fail("Unknown objc type:", objc_type)
 
 
+# Loads the class dicts and enums found by sds_parse_objc.py, either from
+# .sdsjson files or directly from sds_parse_objc.parse_objc_files().
+def load_parsed_classes(class_dicts, enums):
+    class_map = {}
+    for class_dict in class_dicts:
+        clazz = ParsedClass(class_dict)
+        class_map[clazz.name] = clazz
+
+    enum_type_map.update(enums)
+    return class_map
+
+
 def parse_sds_json(file_path):
+    start_time = time.perf_counter()
     with open(file_path, "rt") as f:
         json_str = f.read()
     json_data = json.loads(json_str)
 
     classes = json_data["classes"]
-    class_map = {}
-    for class_dict in classes:
-        clazz = ParsedClass(class_dict)
-        class_map[clazz.name] = clazz
+    class_map = load_parsed_classes(classes, json_data["enums"])
 
-    enums = json_data["enums"]
-    enum_type_map.update(enums)
+    # Files under the src path are parsed again after the search path, but
+    # their parse metrics should only be counted once.
+    if (
+        timing.enabled
+        and sds_common.sds_to_relative_path(file_path) not in timing.file_metrics
+    ):
+        seconds = time.perf_counter() - start_time
+        timing.add_file_metrics(
+            file_path,
+            {
+                "seconds": seconds,
+                "parse_seconds": seconds,
+                "ast_bytes": len(json_str),
+                "class_count": len(classes),
+                "property_count": sum(
+                    len(class_dict["properties"]) for class_dict in classes
+                ),
+            },
+        )
 
     return class_map
 
@@ -2718,12 +2847,35 @@ def try_to_parse_file(file_path):
         return {}
 
 
-def find_sds_intermediary_files_in_path(path):
+# Dirs that never contain .sdsjson files, which we don't walk into.
+PRUNED_DIR_NAMES = ("Pods", "ThirdParty", "DerivedData", "fastlane")
+PRUNED_DIR_EXTENSIONS = (".xcodeproj", ".xcworkspace", ".xcassets", ".lproj")
+
+
+def should_prune_dir(dirname):
+    return (
+        dirname.startswith(".")
+        or dirname in PRUNED_DIR_NAMES
+        or dirname.endswith(PRUNED_DIR_EXTENSIONS)
+    )
+
+
+# If sds_parse_objc.py left a manifest of the .sdsjson files it wrote, we
+# read those in path rather than walking it.
+def find_sds_intermediary_files_in_path(path, manifest_file_paths):
     class_map = {}
     if os.path.isfile(path):
         class_map.update(try_to_parse_file(path))
+    elif manifest_file_paths is not None:
+        dir_prefix = os.path.join(path, "")
+        for file_path in manifest_file_paths:
+            if file_path.startswith(dir_prefix):
+                class_map.update(parse_sds_json(file_path))
     else:
         for rootdir, dirnames, filenames in os.walk(path):
+            dirnames[:] = [
+                dirname for dirname in dirnames if not should_prune_dir(dirname)
+            ]
             for filename in filenames:
                 file_path = os.path.abspath(os.path.join(rootdir, filename))
                 class_map.update(try_to_parse_file(file_path))
@@ -2739,15 +2891,126 @@ def update_subclass_map():
 
 
 def all_descendents_of_class(clazz):
-    result = []
+    return list(global_class_hierarchy.descendants(clazz))
 
-    subclasses = global_subclass_map.get(clazz.name, [])
-    subclasses.sort(key=lambda value: value.name)
-    for subclass in subclasses:
-        result.append(subclass)
-        result.extend(all_descendents_of_class(subclass))
 
-    return result
+# ---- Class Hierarchy
+
+
+# An index of global_class_map's class hierarchy, built once the class
+# maps are settled, so that walking up or down it doesn't repeatedly walk
+# global_class_map.
+#
+# It's built without recursion, so deep hierarchies are fine.
+class ClassHierarchy:
+    def __init__(self, class_map, subclass_map):
+        # For each class, its name followed by the names of its superclasses.
+        self.superclass_names_map = {}
+        self.table_superclass_map = {}
+        self.sds_model_names = set()
+        for clazz in class_map.values():
+            self.index_superclasses(class_map, clazz)
+
+        # For each class, its descendants in depth-first order, with
+        # siblings sorted by name.
+        self.descendants_map = {}
+        sorted_subclass_map = {
+            class_name: sorted(subclasses, key=lambda value: value.name)
+            for class_name, subclasses in subclass_map.items()
+        }
+        for class_name in sorted_subclass_map:
+            self.index_descendants(sorted_subclass_map, class_name)
+
+    def index_superclasses(self, class_map, clazz):
+        # Find the classes up the chain that haven't been indexed yet, then
+        # index them from the top down.
+        unindexed_classes = []
+        while clazz is not None and clazz.name not in self.superclass_names_map:
+            unindexed_classes.append(clazz)
+            clazz = class_map.get(clazz.super_class_name)
+        for clazz in reversed(unindexed_classes):
+            super_class_name = clazz.super_class_name
+            if super_class_name not in class_map:
+                self.superclass_names_map[clazz.name] = (clazz.name,)
+                self.table_superclass_map[clazz.name] = clazz
+                continue
+            self.superclass_names_map[clazz.name] = (
+                clazz.name,
+            ) + self.superclass_names_map[super_class_name]
+            if super_class_name in (
+                OLD_BASE_MODEL_CLASS_NAME,
+                NEW_BASE_MODEL_CLASS_NAME,
+            ):
+                self.table_superclass_map[clazz.name] = clazz
+                self.sds_model_names.add(clazz.name)
+            else:
+                self.table_superclass_map[clazz.name] = self.table_superclass_map[
+                    super_class_name
+                ]
+                if super_class_name in self.sds_model_names:
+                    self.sds_model_names.add(clazz.name)
+
+    def index_descendants(self, sorted_subclass_map, class_name):
+        # An iterative post-order walk, so that each class's descendants
+        # are built from its subclasses'.
+        stack = [(class_name, False)]
+        while len(stack) > 0:
+            class_name, are_subclasses_indexed = stack.pop()
+            if class_name in self.descendants_map:
+                continue
+            subclasses = sorted_subclass_map.get(class_name, ())
+            if not are_subclasses_indexed:
+                stack.append((class_name, True))
+                for subclass in subclasses:
+                    stack.append((subclass.name, False))
+                continue
+            descendants = []
+            for subclass in subclasses:
+                descendants.append(subclass)
+                descendants.extend(self.descendants_map[subclass.name])
+            self.descendants_map[class_name] = tuple(descendants)
+
+    # The queries below also answer for classes that aren't in the index,
+    # e.g. those parsed from src_path, based on their superclass.
+
+    def is_sds_model(self, clazz):
+        super_class_name = clazz.super_class_name
+        if super_class_name not in self.superclass_names_map:
+            return False
+        if super_class_name in (
+            OLD_BASE_MODEL_CLASS_NAME,
+            NEW_BASE_MODEL_CLASS_NAME,
+        ):
+            return True
+        return super_class_name in self.sds_model_names
+
+    def table_superclass(self, clazz):
+        super_class_name = clazz.super_class_name
+        if super_class_name not in self.superclass_names_map:
+            return clazz
+        if super_class_name in (
+            OLD_BASE_MODEL_CLASS_NAME,
+            NEW_BASE_MODEL_CLASS_NAME,
+        ):
+            return clazz
+        return self.table_superclass_map[super_class_name]
+
+    def superclass_names(self, clazz):
+        super_class_name = clazz.super_class_name
+        if super_class_name not in self.superclass_names_map:
+            return (clazz.name,)
+        return (clazz.name,) + self.superclass_names_map[super_class_name]
+
+    def descendants(self, clazz):
+        return self.descendants_map.get(clazz.name, ())
+
+
+global_class_hierarchy = ClassHierarchy({}, {})
+
+
+def update_class_hierarchy():
+    global global_class_hierarchy
+    global_class_hierarchy = ClassHierarchy(global_class_map, global_subclass_map)
 
 
 def is_swift_class_name(swift_type):
@@ -2756,7 +3019,156 @@ def is_swift_class_name(swift_type):
 
 # ---- Config JSON
 
-configuration_json = {}
+# The fields that each manually_typed_fields entry must specify, and their
+# types.
+MANUALLY_TYPED_FIELD_TYPES = {
+    "swift_type": str,
+    "objc_initializer_type": str,
+    "is_objc_codable": bool,
+    "is_enum": bool,
+    "column_type": str,
+    "record_swift_type": str,
+    "serialize_record_invocation": str,
+    "should_use_blob": bool,
+}
+
+
+# The configuration of a single property, compiled from the
+# "ClassName.propertyName" keys of the config JSON.
+class PropertyConfig:
+    def __init__(self):
+        self.nsnumber_type = None
+        self.should_ignore = False
+        self.field_overrides = None
+        self.accessor_name = None
+        self.custom_column_name = None
+        self.aliased_column_name = None
+        self.renamed_column_name = None
+
+
+DEFAULT_PROPERTY_CONFIG = PropertyConfig()
+
+
+# The config JSON, validated and compiled into lookup tables once, so that
+# a malformed config fails before we generate anything.
+class Configuration:
+    def __init__(self, json_data):
+        if not isinstance(json_data, dict):
+            fail("Configuration JSON should be a dict.")
+        self.json_data = json_data
+
+        # Keyed by (class name, property name).
+        self.property_configs = {}
+        nsnumber_types = self.property_map(
+            "nsnumber_types",
+            "Configuration JSON is missing mapping for properties of type NSNumber.",
+        )
+        for key, swift_type in nsnumber_types.items():
+            self.property_config(key).nsnumber_type = swift_type
+        for key in self.name_list(
+            "properties_to_ignore",
+            "Configuration JSON is missing list of properties to ignore during serialization.",
+        ):
+            self.property_config(key).should_ignore = True
+        manually_typed_fields = self.value(
+            "manually_typed_fields",
+            dict,
+            "Configuration JSON is missing manually_typed_fields",
+        )
+        for key, field_overrides in manually_typed_fields.items():
+            if not isinstance(field_overrides, dict):
+                fail("Configuration JSON has invalid manually_typed_fields:", key)
+            for field, field_type in MANUALLY_TYPED_FIELD_TYPES.items():
+                if not isinstance(field_overrides.get(field), field_type):
+                    fail(
+                        "Configuration JSON has invalid manually_typed_fields:",
+                        key,
+                        field,
+                    )
+            self.property_config(key).field_overrides = field_overrides
+        custom_accessors = self.property_map(
+            "custom_accessors",
+            "Configuration JSON is missing list of custom property accessors.",
+        )
+        for key, accessor_name in custom_accessors.items():
+            self.property_config(key).accessor_name = accessor_name
+        custom_column_names = self.property_map(
+            "custom_column_names",
+            "Configuration JSON is missing list of custom column names.",
+        )
+        for key, column_name in custom_column_names.items():
+            self.property_config(key).custom_column_name = column_name
+        aliased_column_names = self.property_map(
+            "aliased_column_names",
+            "Configuration JSON is missing dict of aliased_column_names.",
+        )
+        for key, column_name in aliased_column_names.items():
+            self.property_config(key).aliased_column_name = column_name
+        renamed_column_names = self.property_map(
+            "renamed_column_names",
+            "Configuration JSON is missing list of renamed column names.",
+        )
+        for key, column_name in renamed_column_names.items():
+            self.property_config(key).renamed_column_name = column_name
+
+        # Keyed by class name.
+        self.class_cache_get_code = self.class_map(
+            "class_cache_get_code",
+            "Configuration JSON is missing dict of class_cache_get_code.",
+        )
+        self.class_cache_set_code = self.class_map(
+            "class_cache_set_code",
+            "Configuration JSON is missing dict of class_cache_set_code.",
+        )
+        self.class_names_to_skip_serialization = frozenset(
+            self.name_list(
+                "class_to_skip_serialization",
+                "Configuration JSON is missing list of classes to ignore during serialization.",
+            )
+        )
+
+    def value(self, config_key, value_type, missing_message):
+        value = self.json_data.get(config_key)
+        if value is None:
+            fail(missing_message)
+        if not isinstance(value, value_type):
+            fail("Configuration JSON has invalid %s." % (config_key,))
+        return value
+
+    def name_list(self, config_key, missing_message):
+        names = self.value(config_key, list, missing_message)
+        for name in names:
+            if not isinstance(name, str):
+                fail("Configuration JSON has invalid %s:" % (config_key,), name)
+        return names
+
+    def class_map(self, config_key, missing_message):
+        class_map = self.value(config_key, dict, missing_message)
+        for value in class_map.values():
+            if not isinstance(value, str):
+                fail("Configuration JSON has invalid %s:" % (config_key,), value)
+        return class_map
+
+    # A dict from "ClassName.propertyName" to a string.
+    def property_map(self, config_key, missing_message):
+        property_map = self.class_map(config_key, missing_message)
+        for key in property_map:
+            self.property_config(key)
+        return property_map
+
+    def property_config(self, key):
+        components = key.split(".")
+        if len(components) != 2 or "" in components:
+            fail("Configuration JSON has invalid property key:", key)
+        property_key = tuple(components)
+        property_config = self.property_configs.get(property_key)
+        if property_config is None:
+            property_config = PropertyConfig()
+            self.property_configs[property_key] = property_config
+        return property_config
+
+
+configuration = None
 
 
 def parse_config_json(config_json_path):
@@ -2764,25 +3176,26 @@ def parse_config_json(config_json_path):
         json_str = f.read()
 
     json_data = json.loads(json_str)
-    global configuration_json
-    configuration_json = json_data
+    global configuration
+    configuration = Configuration(json_data)
+
+
+def property_config(property):
+    return configuration.property_configs.get(
+        (property.class_name, property.name), DEFAULT_PROPERTY_CONFIG
+    )
 
 
 # We often use nullable NSNumber * for optional numerics (bool, int, int64, double, etc.).
 # There's now way to infer which type we're boxing in NSNumber.
 # Therefore, we need to specify that in the configuration JSON.
 def swift_type_for_nsnumber(property):
-    nsnumber_types = configuration_json.get("nsnumber_types")
-    if nsnumber_types is None:
-        print("Suggestion: update: %s" % (str(global_args.config_json_path),))
-        fail("Configuration JSON is missing mapping for properties of type NSNumber.")
-    key = property.class_name + "." + property.name
-    swift_type = nsnumber_types.get(key)
+    swift_type = property_config(property).nsnumber_type
     if swift_type is None:
-        print("Suggestion: update: %s" % (str(global_args.config_json_path),))
+        print("Suggestion: update: %s" % (str(global_config_json_path),))
         fail(
             "Configuration JSON is missing mapping for properties of type NSNumber:",
-            key,
+            property.class_name + "." + property.name,
         )
     return swift_type
 
@@ -2793,80 +3206,43 @@ def swift_type_for_nsnumber(property):
 # Or we might store these as Data/NSData/blob.
 # TODO:
 def should_ignore_property(property):
-    properties_to_ignore = configuration_json.get("properties_to_ignore")
-    if properties_to_ignore is None:
-        fail(
-            "Configuration JSON is missing list of properties to ignore during serialization."
-        )
-    key = property.class_name + "." + property.name
-    return key in properties_to_ignore
+    return property_config(property).should_ignore
 
 
 def cache_get_code_for_class(clazz):
-    code_map = configuration_json.get("class_cache_get_code")
-    if code_map is None:
-        fail("Configuration JSON is missing dict of class_cache_get_code.")
-    key = clazz.name
-    return code_map.get(key)
+    return configuration.class_cache_get_code.get(clazz.name)
 
 
 def cache_set_code_for_class(clazz):
-    code_map = configuration_json.get("class_cache_set_code")
-    if code_map is None:
-        fail("Configuration JSON is missing dict of class_cache_set_code.")
-    key = clazz.name
-    return code_map.get(key)
+    return configuration.class_cache_set_code.get(clazz.name)
 
 
 def should_ignore_class(clazz):
-    class_to_skip_serialization = configuration_json.get("class_to_skip_serialization")
-    if class_to_skip_serialization is None:
-        fail(
-            "Configuration JSON is missing list of classes to ignore during serialization."
-        )
-    if clazz.name in class_to_skip_serialization:
-        return True
-
-    if clazz.super_class_name is None:
-        return False
-    if not clazz.super_class_name in global_class_map:
-        return False
-    super_clazz = global_class_map[clazz.super_class_name]
-    return should_ignore_class(super_clazz)
+    class_names_to_skip_serialization = configuration.class_names_to_skip_serialization
+    for class_name in global_class_hierarchy.superclass_names(clazz):
+        if class_name in class_names_to_skip_serialization:
+            return True
+    return False
 
 
 def accessor_name_for_property(property):
-    custom_accessors = configuration_json.get("custom_accessors")
-    if custom_accessors is None:
-        fail("Configuration JSON is missing list of custom property accessors.")
-    key = property.class_name + "." + property.name
-    return custom_accessors.get(key, property.name)
+    accessor_name = property_config(property).accessor_name
+    if accessor_name is None:
+        return property.name
+    return accessor_name
 
 
 # include_renamed_columns
 def custom_column_name_for_property(property):
-    custom_column_names = configuration_json.get("custom_column_names")
-    if custom_column_names is None:
-        fail("Configuration JSON is missing list of custom column names.")
-    key = property.class_name + "." + property.name
-    return custom_column_names.get(key)
+    return property_config(property).custom_column_name
 
 
 def aliased_column_name_for_property(property):
-    custom_column_names = configuration_json.get("aliased_column_names")
-    if custom_column_names is None:
-        fail("Configuration JSON is missing dict of aliased_column_names.")
-    key = property.class_name + "." + property.name
-
-    return custom_column_names.get(key)
+    return property_config(property).aliased_column_name
 
 
 def was_property_renamed_for_property(property):
-    renamed_column_names = configuration_json.get("renamed_column_names")
-    if renamed_column_names is None:
-        fail("Configuration JSON is missing list of renamed column names.")
-    key = property.class_name + "." + property.name
-    return renamed_column_names.get(key) is not None
+    return property_config(property).renamed_column_name is not None
 
 
 # ---- Config JSON
@@ -2906,9 +3282,98 @@ def property_order_for_property(property, record_name):
     return result
 
 
+# The orders assigned by set_property_order_for_property() in the current
+# generate_model_job().
+assigned_property_orders = {}
+
+
 def set_property_order_for_property(property, record_name, value):
     key = property_order_key(property, record_name)
     property_order_json[key] = value
+    assigned_property_orders[key] = value
+
+
+# Generates the Swift extensions for the model classes in src_path, using
+# the classes in search_path to understand the class hierarchy. The
+# .sdsjson files are found with the manifest in cache_dir_path, if any.
+#
+# sds_pipeline.py instead passes the parsed_classes (class dicts and
+# enums) from sds_parse_objc.py, in which case no .sdsjson files are read
+# and the same classes are used for both.
+#
+# Models are generated in parallel if jobs > 1.
+def generate(
+    src_path,
+    search_path,
+    cache_dir_path,
+    parsed_classes,
+    jobs,
+    record_type_swift_path,
+    record_type_json_path,
+    config_json_path,
+    property_order_json_path,
+):
+    global global_config_json_path
+    record_type_swift_path = os.path.abspath(record_type_swift_path)
+    record_type_json_path = os.path.abspath(record_type_json_path)
+    config_json_path = os.path.abspath(config_json_path)
+    property_order_json_path = os.path.abspath(property_order_json_path)
+    global_config_json_path = config_json_path
+
+    # Outputs are only written once everything has been generated.
+    with sds_common.batched_writes():
+        # We control the code generation process using a JSON config file.
+        with timing.stage("parse config"):
+            parse_config_json(config_json_path)
+            parse_property_order_json(property_order_json_path)
+
+        # The code generation needs to understand the class hierarchy so that
+        # it can:
+        #
+        # * Define table schemas that include the superset of properties in
+        #   the model class hierarchies.
+        # * Generate deserialization methods that handle all subclasses.
+        # * etc.
+        manifest_file_paths = None
+        if parsed_classes is None and cache_dir_path is not None:
+            manifest_file_paths = sds_common.read_sds_json_manifest(
+                os.path.abspath(cache_dir_path)
+            )
+            if manifest_file_paths is None:
+                print("No up-to-date .sdsjson manifest, searching for .sdsjson files.")
+        if parsed_classes is None:
+            with timing.stage("parse search path"):
+                global_class_map.update(
+                    find_sds_intermediary_files_in_path(
+                        os.path.abspath(search_path), manifest_file_paths
+                    )
+                )
+            if len(global_class_map) == 0:
+                fail(
+                    "No .sdsjson files found in search path:",
+                    search_path,
+                    "(run sds_parse_objc.py or `sds_codegen.sh --write-sdsjson` first)",
+                )
+        else:
+            with timing.stage("load parsed classes"):
+                global_class_map.update(load_parsed_classes(*parsed_classes))
+        update_subclass_map()
+        update_class_hierarchy()
+        with timing.stage("update record type map"):
+            update_record_type_map(record_type_swift_path, record_type_json_path)
+        if parsed_classes is None:
+            with timing.stage("parse src path"):
+                class_map = find_sds_intermediary_files_in_path(
+                    os.path.abspath(src_path), manifest_file_paths
+                )
+        else:
+            class_map = dict(global_class_map)
+        with timing.stage("generate"):
+            process_class_map(class_map, jobs)
+
+        # Persist updated property order
+        with timing.stage("update property order"):
+            update_property_order_json(property_order_json_path)
 
 
 if __name__ == "__main__":
@@ -2940,32 +3405,41 @@ if __name__ == "__main__":
         required=True,
         help="path of the json file with property ordering cache.",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of models to generate in parallel.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="path of sds_parse_objc.py's cache dir, whose manifest lists the .sdsjson files to read. Without it, the search path is walked.",
+    )
+    parser.add_argument(
+        "--repo-root",
+        help="path of the repo's root dir. By default, it's found from the current dir.",
+    )
+    parser.add_argument(
+        "--timing-report",
+        help="path of a JSON file in which to record per-file and per-stage timings.",
+    )
     args = parser.parse_args()
 
-    global_args = args
-
-    src_path = os.path.abspath(args.src_path)
-    search_path = os.path.abspath(args.search_path)
-    record_type_swift_path = os.path.abspath(args.record_type_swift_path)
-    record_type_json_path = os.path.abspath(args.record_type_json_path)
-    config_json_path = os.path.abspath(args.config_json_path)
-    property_order_json_path = os.path.abspath(args.property_order_json_path)
-
-    # We control the code generation process using a JSON config file.
-    parse_config_json(config_json_path)
-    parse_property_order_json(property_order_json_path)
+    if args.repo_root is not None:
+        sds_common.set_repo_root(args.repo_root)
+
+    timing = sds_common.TimingReport("sds_generate", args.timing_report)
+
+    generate(
+        args.src_path,
+        args.search_path,
+        args.cache_dir,
+        None,
+        args.jobs,
+        args.record_type_swift_path,
+        args.record_type_json_path,
+        args.config_json_path,
+        args.property_order_json_path,
+    )
 
-    # The code generation needs to understand the class hierarchy so that
-    # it can:
-    #
-    # * Define table schemas that include the superset of properties in
-    #   the model class hierarchies.
-    # * Generate deserialization methods that handle all subclasses.
-    # * etc.
-    global_class_map.update(find_sds_intermediary_files_in_path(search_path))
-    update_subclass_map()
-    update_record_type_map(record_type_swift_path, record_type_json_path)
-    process_class_map(find_sds_intermediary_files_in_path(src_path))
-
-    # Persist updated property order
-    update_property_order_json(property_order_json_path)
+    timing.finish()
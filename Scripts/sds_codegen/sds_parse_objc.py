@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import subprocess
 import argparse
+import atexit
+import concurrent.futures
+import ctypes
+import functools
+import hashlib
+import traceback
+from typing import Iterable
 import re
 import json
 import sds_common
 from sds_common import fail
 import tempfile
 import shutil
-
-git_repo_path = sds_common.git_repo_path
+import struct
+import time
 
 
 def ows_getoutput(cmd: list[str]) -> tuple[int, str, str]:
@@ -22,19 +30,28 @@ def ows_getoutput(cmd: list[str]) -> tuple[int, str, str]:
     return proc.returncode, stdout, stderr
 
 
+# Reads lines one at a time from any iterable of lines (e.g. a pipe),
+# with one line of lookahead, so that a large AST never has to be held
+# in memory all at once.
 class LineProcessor:
-    def __init__(self, text):
-        self.lines = text.split("\n")
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.next_line = None
+        self.advance()
+
+    def advance(self):
+        line = next(self.lines, None)
+        if line is not None:
+            line = line.rstrip("\n")
+        self.next_line = line
 
     def hasNext(self):
-        return len(self.lines) > 0
+        return self.next_line is not None
 
     def next(self, should_pop=False):
-        if len(self.lines) == 0:
-            return None
-        line = self.lines[0]
-        if should_pop:
-            self.lines = self.lines[1:]
+        line = self.next_line
+        if should_pop and line is not None:
+            self.advance()
         return line
 
     def popNext(self):
@@ -119,7 +136,6 @@ class ParsedClass:
                     # Ignore built in protocols.
                     continue
                 print("clazz:", self.name)
-                print("file_path:", file_path)
                 fail("Missing protocol:", protocol_name)
 
             result.append(protocol)
@@ -139,6 +155,11 @@ class ParsedProperty:
 class Namespace:
     def __init__(self):
         self.class_map = {}
+        # Enum declarations are recorded in AST order and applied to
+        # enum_type_map by apply_enum_declarations(), which lets files be
+        # parsed out of order (e.g. on a process pool) while enum_type_map
+        # still evolves exactly as it would in a serial run.
+        self.enum_declarations = []
 
     def upsert_class(self, class_name):
         clazz = self.class_map.get(class_name)
@@ -169,18 +190,18 @@ def split_objc_ast_prefix(line):
     return prefix, remainder
 
 
-def process_objc_ast(namespace: Namespace, file_path: str, raw_ast: str) -> None:
+def process_objc_ast(
+    namespace: Namespace, file_path: str, ast_lines: Iterable[str]
+) -> None:
     m_filename = os.path.basename(file_path)
     file_base, file_extension = os.path.splitext(m_filename)
     if file_extension != ".m":
         fail("Bad file extension:", file_extension)
     h_filename = file_base + ".h"
 
-    # TODO: Remove
-    lines = raw_ast.split("\n")
-    raw_ast = "\n".join(lines)
-
-    lines = LineProcessor(raw_ast)
+    lines = LineProcessor(ast_lines)
+    if not lines.hasNext():
+        fail("Empty AST:", file_path)
     while lines.hasNext():
         line = lines.popNext()
         prefix, remainder = split_objc_ast_prefix(line)
@@ -235,9 +256,7 @@ def process_objc_enum_declaration(namespace, file_path, lines, prefix, remainder
 
     if type1.startswith("line:"):
         return
-    if type1 in enum_type_map:
-        return
-    enum_type_map[type1] = type2
+    namespace.enum_declarations.append(("enum", type1, type2))
 
 
 # |-TypedefDecl 0x7f8d8fb44748 <line:12:1, line:22:3> col:3 referenced RPRecentCallType 'enum RPRecentCallType':'RPRecentCallType'
@@ -262,12 +281,24 @@ def process_objc_type_declaration(namespace, file_path, lines, prefix, remainder
     if type3.startswith("line:"):
         print("Ignoring invalid enum(2):", type1, type2, type3)
         return
-    if type3 not in enum_type_map:
-        print("Enum has unknown type:", type3)
-        enum_type = "NSUInteger"
-    else:
-        enum_type = enum_type_map[type3]
-    enum_type_map[type3] = enum_type
+    namespace.enum_declarations.append(("typedef", type3))
+
+
+def apply_enum_declarations(enum_declarations):
+    for declaration in enum_declarations:
+        if declaration[0] == "enum":
+            _, enum_name, enum_type = declaration
+            if enum_name in enum_type_map:
+                continue
+            enum_type_map[enum_name] = enum_type
+        else:
+            _, enum_name = declaration
+            if enum_name not in enum_type_map:
+                print("Enum has unknown type:", enum_name)
+                enum_type = "NSUInteger"
+            else:
+                enum_type = enum_type_map[enum_name]
+            enum_type_map[enum_name] = enum_type
 
 
 # |-ObjCInterfaceDecl 0x10f5d2b60 <SignalDataStoreCommon/ObjCBaseModel.h:15:1, col:8> col:8 SDSDataStore
@@ -373,17 +404,7 @@ def process_objc_class(
     else:
         class_name = decl_remainder.split(" ")[-1]
 
-    clazz = namespace.upsert_class(class_name)
-
-    if super_class_name is not None:
-        if clazz.super_class_name is None:
-            clazz.super_class_name = super_class_name
-        elif clazz.super_class_name != super_class_name:
-            fail(
-                "super_class_name does not match:",
-                clazz.super_class_name,
-                super_class_name,
-            )
+    clazz = upsert_objc_class(namespace, class_name, super_class_name)
 
     while lines.hasNext():
         line = lines.next()
@@ -417,6 +438,22 @@ def process_objc_class(
     return clazz
 
 
+def upsert_objc_class(namespace, class_name, super_class_name=None):
+    clazz = namespace.upsert_class(class_name)
+
+    if super_class_name is not None:
+        if clazz.super_class_name is None:
+            clazz.super_class_name = super_class_name
+        elif clazz.super_class_name != super_class_name:
+            fail(
+                "super_class_name does not match:",
+                clazz.super_class_name,
+                super_class_name,
+            )
+
+    return clazz
+
+
 process_objc_method_decl_regex = re.compile(r" - (sdsFinalize[^ ]*?) 'void'$")
 
 
@@ -455,6 +492,10 @@ def process_objc_property_impl(clazz, prefix, file_path, line, remainder):
         print("file_path:", file_path)
         fail("Could not match line:", line)
     property_name = match.group(1).strip()
+    synthesize_objc_property(clazz, file_path, line, property_name)
+
+
+def synthesize_objc_property(clazz, file_path, line, property_name):
     property = clazz.get_property(property_name)
     if property is None:
         if clazz.name == "AppDelegate" and property_name == "window":
@@ -504,9 +545,31 @@ def process_objc_property(clazz, prefix, file_path, line, remainder):
     property_type_1 = get_match_group(match, 2)
     property_type_2 = get_match_group(match, 4)
     property_keywords = match.group(5).strip().split(" ")
+    is_readonly = "readonly" in property_keywords
 
+    add_objc_property(
+        clazz,
+        file_path,
+        remainder,
+        property_name,
+        property_type_1,
+        property_type_2,
+        is_readonly,
+    )
+
+
+# property_type_1 is the type as written and property_type_2 is the
+# desugared type, or "" if they are the same.
+def add_objc_property(
+    clazz,
+    file_path,
+    remainder,
+    property_name,
+    property_type_1,
+    property_type_2,
+    is_readonly,
+):
     is_optional = (property_type_2 + " _Nullable") == property_type_1
-    is_readonly = "readonly" in property_keywords
 
     property_type = property_type_2
     if len(property_type_2) < 1:
@@ -553,7 +616,508 @@ def process_objc_property(clazz, prefix, file_path, line, remainder):
         property.is_not_readonly = True
 
 
-def emit_output(file_path, namespace):
+# --- JSON AST
+
+# The JSON backend (-ast-dump=json) feeds the same model as the text
+# backend, but only decodes the top-level declarations that can affect
+# the output. Class declarations are pruned by source location: only
+# those from project files (including the module headers) are kept,
+# which skips the bulk of the SDK. Protocols, enums and typedefs are
+# kept from every file, as the text backend does, so that classes can
+# adopt SDK protocols and use SDK enums.
+#
+# clang indents its JSON AST by two spaces per level, so the top-level
+# declarations (the "inner" of the TranslationUnitDecl) open and close at
+# an indent of four and their attributes are at an indent of six:
+#
+# {
+#   "id": "0x7fd0e5813a08",
+#   "kind": "TranslationUnitDecl",
+#   ...
+#   "inner": [
+#     {
+#       "id": "0x7fd0e6a5e6c8",
+#       "kind": "ObjCInterfaceDecl",
+#       "loc": {
+#         "offset": 352,
+#         "file": "/Users/matthew/code/workspace/ows/Signal-iOS-2/SignalServiceKit/src/Messages/TSCall.h",
+#         "line": 14,
+#         "col": 12,
+#         "tokLen": 6
+#       },
+#       ...
+#     },
+#
+# Locations only include a "file" when it differs from that of the
+# previous location in the dump, so every line is scanned to keep track
+# of the current file.
+json_ast_decl_start = "    {"
+json_ast_decl_ends = ("    }", "    },")
+json_ast_decl_kind_prefix = '      "kind": "'
+json_ast_decl_loc_prefix = '      "loc": {'
+json_ast_decl_loc_ends = ("      }", "      },")
+json_ast_decl_inner = '      "inner": ['
+json_ast_file_regex = re.compile(r'^ *"file": (".*"),?$')
+
+# Declarations that are only kept if they come from a project file.
+json_ast_project_decl_kinds = (
+    "ObjCInterfaceDecl",
+    "ObjCCategoryDecl",
+    "ObjCImplementationDecl",
+)
+# Declarations whose children we don't need.
+json_ast_childless_decl_kinds = (
+    "TypedefDecl",
+    "EnumDecl",
+)
+json_ast_decl_kinds = (
+    json_ast_project_decl_kinds + json_ast_childless_decl_kinds + ("ObjCProtocolDecl",)
+)
+
+
+# Returns a function that tests whether a file (as named by clang) is in
+# one of the given directories.
+def project_file_matcher(project_dir_paths):
+    project_dir_prefixes = tuple(
+        os.path.join(os.path.abspath(dir_path), "") for dir_path in project_dir_paths
+    )
+    project_file_map = {}
+
+    def is_project_file(file_path):
+        if file_path is None:
+            return False
+        result = project_file_map.get(file_path)
+        if result is None:
+            result = os.path.abspath(file_path).startswith(project_dir_prefixes)
+            project_file_map[file_path] = result
+        return result
+
+    return is_project_file
+
+
+def process_objc_json_ast(
+    namespace: Namespace,
+    file_path: str,
+    ast_lines: Iterable[str],
+    project_dir_paths: list[str],
+) -> None:
+    is_project_file = project_file_matcher(project_dir_paths)
+
+    decl_count = 0
+    current_file_path = None
+    previous_line = ""
+    is_in_decl = False
+    for line in ast_lines:
+        line = line.rstrip("\n")
+
+        if not is_in_decl:
+            if line == json_ast_decl_start:
+                is_in_decl = True
+                is_in_decl_loc = False
+                decl_count = decl_count + 1
+                decl_kind = None
+                # The lines of the declaration, while we're keeping it.
+                decl_lines = [line]
+                is_decl_complete = False
+            previous_line = line
+            continue
+
+        if line in json_ast_decl_ends:
+            if decl_lines is not None:
+                if is_decl_complete:
+                    # Drop the trailing comma of the last attribute.
+                    decl_lines[-1] = decl_lines[-1].rstrip(",")
+                decl_lines.append(json_ast_decl_ends[0])
+                decl = json.loads("\n".join(decl_lines))
+                process_objc_json_decl(namespace, file_path, decl)
+            is_in_decl = False
+            previous_line = line
+            continue
+
+        if '"file": ' in line and not previous_line.endswith('"includedFrom": {'):
+            match = json_ast_file_regex.search(line)
+            if match is not None:
+                current_file_path = json.loads(match.group(1))
+
+        if decl_lines is not None and not is_decl_complete:
+            if decl_kind is None and line.startswith(json_ast_decl_kind_prefix):
+                decl_kind = line[len(json_ast_decl_kind_prefix) :].rstrip(",")
+                decl_kind = decl_kind.rstrip('"')
+                if decl_kind not in json_ast_decl_kinds:
+                    decl_lines = None
+            elif line.startswith(json_ast_decl_loc_prefix):
+                if line.endswith("{},"):
+                    # Implicit declarations have no location.
+                    if decl_kind in json_ast_project_decl_kinds:
+                        decl_lines = None
+                else:
+                    is_in_decl_loc = True
+            elif is_in_decl_loc and line in json_ast_decl_loc_ends:
+                is_in_decl_loc = False
+                if decl_kind in json_ast_project_decl_kinds and not is_project_file(
+                    current_file_path
+                ):
+                    decl_lines = None
+            elif line == json_ast_decl_inner:
+                is_decl_complete = decl_kind in json_ast_childless_decl_kinds
+
+            if decl_lines is not None and not is_decl_complete:
+                decl_lines.append(line)
+
+        previous_line = line
+
+    if decl_count == 0:
+        fail("Empty AST:", file_path)
+
+
+def process_objc_json_decl(namespace, file_path, decl):
+    decl_kind = decl["kind"]
+    if decl_kind == "EnumDecl":
+        # "fixedUnderlyingType": {
+        #   "qualType": "NSUInteger",
+        #   "desugaredQualType": "unsigned long",
+        #   "typeAliasDeclId": "0x7fd0e581d1a8"
+        # },
+        enum_name = decl.get("name")
+        underlying_type = decl.get("fixedUnderlyingType", {})
+        if enum_name is None or "desugaredQualType" not in underlying_type:
+            return
+        namespace.enum_declarations.append(
+            ("enum", enum_name, underlying_type["qualType"])
+        )
+        return
+    elif decl_kind == "TypedefDecl":
+        # "type": {
+        #   "qualType": "enum RPRecentCallType",
+        #   "desugaredQualType": "RPRecentCallType"
+        # },
+        typedef_type = decl["type"]
+        desugared_type = typedef_type.get("desugaredQualType")
+        if (
+            desugared_type is None
+            or typedef_type["qualType"] != "enum " + desugared_type
+        ):
+            return
+        namespace.enum_declarations.append(("typedef", desugared_type))
+        return
+
+    if decl_kind == "ObjCInterfaceDecl":
+        super_class_name = decl.get("super", {}).get("name")
+        clazz = upsert_objc_class(namespace, decl["name"], super_class_name)
+    elif decl_kind == "ObjCCategoryDecl":
+        clazz = upsert_objc_class(namespace, decl["interface"]["name"])
+    else:
+        # ObjCImplementationDecl or ObjCProtocolDecl.
+        clazz = upsert_objc_class(namespace, decl["name"])
+        clazz.is_implemented = True
+
+    for protocol in decl.get("protocols", []):
+        clazz.inherit_from_protocol(namespace, protocol["name"])
+
+    for member in decl.get("inner", []):
+        process_objc_json_member(clazz, file_path, member)
+
+
+def process_objc_json_member(clazz, file_path, member):
+    member_kind = member["kind"]
+    if member_kind == "ObjCPropertyDecl":
+        property_type = member["type"]
+        add_objc_property(
+            clazz,
+            file_path,
+            member_kind + " " + member["name"],
+            member["name"],
+            property_type["qualType"],
+            property_type.get("desugaredQualType", ""),
+            member.get("readonly", False),
+        )
+    elif member_kind == "ObjCPropertyImplDecl":
+        if member["implKind"] != "synthesize":
+            return
+        synthesize_objc_property(
+            clazz, file_path, member_kind + " " + member["name"], member["name"]
+        )
+    elif member_kind == "ObjCMethodDecl":
+        if (
+            member.get("instance", False)
+            and member["name"].startswith("sdsFinalize")
+            and member["returnType"]["qualType"] == "void"
+        ):
+            clazz.finalize_method_name = member["name"]
+
+
+# --- libclang
+
+# The libclang backend parses each file in-process with the libclang
+# Python bindings (clang.cindex), which are only imported if it's used.
+# Each process keeps a single Index, and function bodies are skipped.
+#
+# It walks the same top-level declarations as the JSON backend, with the
+# same pruning of class declarations outside the project, and fills in
+# the same model.
+#
+# libclang doesn't expose the property implementations that clang
+# synthesizes implicitly, so auto-synthesis is approximated: a property
+# declared in a class's @interface or class extension is treated as
+# synthesized by the class's @implementation unless it's @dynamic, a
+# class property, or has all of its accessors implemented there.
+
+# See CXTranslationUnit_Flags and CXObjCPropertyAttrKind in clang-c/Index.h.
+# Without attributed types, libclang drops nullability from types.
+LIBCLANG_PARSE_INCLUDE_ATTRIBUTED_TYPES = 0x1000
+LIBCLANG_PROPERTY_ATTR_READONLY = 0x01
+LIBCLANG_PROPERTY_ATTR_CLASS = 0x1000
+
+libclang_index = None
+
+
+def get_cindex():
+    try:
+        import clang.cindex
+    except ImportError:
+        fail(
+            "The libclang backend requires the libclang Python bindings, e.g. `pip3 install libclang`."
+        )
+    return clang.cindex
+
+
+def get_libclang_index():
+    global libclang_index
+    if libclang_index is None:
+        cindex = get_cindex()
+        libclang_path = os.environ.get("SDS_LIBCLANG_PATH")
+        if libclang_path is not None and not cindex.Config.loaded:
+            cindex.Config.set_library_file(libclang_path)
+        libclang_index = cindex.Index.create()
+    return libclang_index
+
+
+# Looks up a libclang function that the bindings don't wrap.
+@functools.cache
+def get_libclang_function(name, argtypes, restype, errcheck=None):
+    cindex = get_cindex()
+    function = getattr(cindex.conf.lib, name)
+    function.argtypes = argtypes
+    function.restype = restype
+    if errcheck is not None:
+        function.errcheck = errcheck
+    return function
+
+
+def get_libclang_property_attributes(cursor):
+    cindex = get_cindex()
+    function = get_libclang_function(
+        "clang_Cursor_getObjCPropertyAttributes",
+        (cindex.Cursor, ctypes.c_uint),
+        ctypes.c_uint,
+    )
+    return function(cursor, 0)
+
+
+def get_libclang_property_accessor_name(cursor, function_name):
+    cindex = get_cindex()
+    function = get_libclang_function(
+        function_name,
+        (cindex.Cursor,),
+        cindex._CXString,
+        cindex._CXString.from_result,
+    )
+    return function(cursor)
+
+
+# The bindings raise for cursor kinds that are newer than they are, none
+# of which we need.
+def get_libclang_cursor_kind(cursor):
+    try:
+        return cursor.kind
+    except ValueError:
+        return None
+
+
+# Returns the type as written and its desugared type, or "" if they are
+# the same, like the types in clang's AST dumps.
+def get_libclang_type_names(libclang_type):
+    type_name = libclang_type.spelling
+    desugared_type_name = libclang_type.get_canonical().spelling
+    if desugared_type_name == type_name:
+        desugared_type_name = ""
+    return type_name, desugared_type_name
+
+
+def process_objc_libclang(
+    namespace: Namespace,
+    file_path: str,
+    command: list[str],
+    project_dir_paths: list[str],
+    metrics: dict = None,
+) -> None:
+    cindex = get_cindex()
+    CursorKind = cindex.CursorKind
+    is_project_file = project_file_matcher(project_dir_paths)
+
+    start_time = time.perf_counter()
+    try:
+        translation_unit = get_libclang_index().parse(
+            file_path,
+            # Drop "clang" and the file path.
+            args=command[1:-1],
+            options=(
+                cindex.TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+                | LIBCLANG_PARSE_INCLUDE_ATTRIBUTED_TYPES
+            ),
+        )
+    except cindex.TranslationUnitLoadError:
+        fail("Could not parse:", file_path)
+    if metrics is not None:
+        # libclang runs in-process, but this is the equivalent of clang's
+        # share of the other backends.
+        metrics["subprocess_seconds"] = time.perf_counter() - start_time
+
+    # Class name => [(property name, getter name, setter name or None)]
+    # for properties that may be auto-synthesized.
+    synthesizable_property_map = {}
+
+    decl_count = 0
+    for cursor in translation_unit.cursor.get_children():
+        decl_count = decl_count + 1
+        kind = get_libclang_cursor_kind(cursor)
+        if kind in (
+            CursorKind.OBJC_INTERFACE_DECL,
+            CursorKind.OBJC_CATEGORY_DECL,
+            CursorKind.OBJC_IMPLEMENTATION_DECL,
+        ):
+            location_file = cursor.location.file
+            if location_file is None or not is_project_file(location_file.name):
+                continue
+        elif kind not in (
+            CursorKind.OBJC_PROTOCOL_DECL,
+            CursorKind.ENUM_DECL,
+            CursorKind.TYPEDEF_DECL,
+        ):
+            continue
+
+        if kind == CursorKind.ENUM_DECL:
+            enum_name = cursor.spelling
+            if enum_name == "" or cursor.is_anonymous():
+                continue
+            type_name, desugared_type_name = get_libclang_type_names(cursor.enum_type)
+            if desugared_type_name == "":
+                continue
+            namespace.enum_declarations.append(("enum", enum_name, type_name))
+            continue
+        elif kind == CursorKind.TYPEDEF_DECL:
+            underlying_type = cursor.underlying_typedef_type
+            enum_cursor = underlying_type.get_canonical().get_declaration()
+            if (
+                get_libclang_cursor_kind(enum_cursor) != CursorKind.ENUM_DECL
+                or enum_cursor.spelling == ""
+            ):
+                continue
+            if underlying_type.spelling != "enum " + enum_cursor.spelling:
+                continue
+            namespace.enum_declarations.append(("typedef", enum_cursor.spelling))
+            continue
+
+        children = list(cursor.get_children())
+        if kind == CursorKind.OBJC_INTERFACE_DECL:
+            super_class_name = None
+            for child in children:
+                if get_libclang_cursor_kind(child) == CursorKind.OBJC_SUPER_CLASS_REF:
+                    super_class_name = child.spelling
+            clazz = upsert_objc_class(namespace, cursor.spelling, super_class_name)
+            declares_synthesizable_properties = True
+        elif kind == CursorKind.OBJC_CATEGORY_DECL:
+            class_name = None
+            for child in children:
+                if get_libclang_cursor_kind(child) == CursorKind.OBJC_CLASS_REF:
+                    class_name = child.spelling
+                    break
+            if class_name is None:
+                fail("Category missing interface.")
+            clazz = upsert_objc_class(namespace, class_name)
+            declares_synthesizable_properties = cursor.spelling == ""
+        else:
+            # ObjCImplementationDecl or ObjCProtocolDecl.
+            clazz = upsert_objc_class(namespace, cursor.spelling)
+            clazz.is_implemented = True
+            declares_synthesizable_properties = False
+
+        for child in children:
+            if get_libclang_cursor_kind(child) == CursorKind.OBJC_PROTOCOL_REF:
+                clazz.inherit_from_protocol(namespace, child.spelling)
+
+        implemented_method_names = set()
+        dynamic_property_names = set()
+        for child in children:
+            child_kind = get_libclang_cursor_kind(child)
+            if child_kind == CursorKind.OBJC_PROPERTY_DECL:
+                property_attributes = get_libclang_property_attributes(child)
+                is_readonly = (
+                    property_attributes & LIBCLANG_PROPERTY_ATTR_READONLY
+                ) != 0
+                type_name, desugared_type_name = get_libclang_type_names(child.type)
+                add_objc_property(
+                    clazz,
+                    file_path,
+                    "ObjCPropertyDecl " + child.spelling,
+                    child.spelling,
+                    type_name,
+                    desugared_type_name,
+                    is_readonly,
+                )
+                if declares_synthesizable_properties and not (
+                    property_attributes & LIBCLANG_PROPERTY_ATTR_CLASS
+                ):
+                    getter_name = get_libclang_property_accessor_name(
+                        child, "clang_Cursor_getObjCPropertyGetterName"
+                    )
+                    setter_name = None
+                    if not is_readonly:
+                        setter_name = get_libclang_property_accessor_name(
+                            child, "clang_Cursor_getObjCPropertySetterName"
+                        )
+                    synthesizable_property_map.setdefault(clazz.name, []).append(
+                        (child.spelling, getter_name, setter_name)
+                    )
+            elif child_kind == CursorKind.OBJC_SYNTHESIZE_DECL:
+                synthesize_objc_property(
+                    clazz,
+                    file_path,
+                    "ObjCPropertyImplDecl " + child.spelling,
+                    child.spelling,
+                )
+            elif child_kind == CursorKind.OBJC_DYNAMIC_DECL:
+                dynamic_property_names.add(child.spelling)
+            elif child_kind == CursorKind.OBJC_INSTANCE_METHOD_DECL:
+                method_name = child.spelling
+                implemented_method_names.add(method_name)
+                if (
+                    method_name.startswith("sdsFinalize")
+                    and child.result_type.spelling == "void"
+                ):
+                    clazz.finalize_method_name = method_name
+
+        if kind == CursorKind.OBJC_IMPLEMENTATION_DECL:
+            for (
+                property_name,
+                getter_name,
+                setter_name,
+            ) in synthesizable_property_map.get(clazz.name, []):
+                if property_name in dynamic_property_names:
+                    continue
+                if getter_name in implemented_method_names and (
+                    setter_name is None or setter_name in implemented_method_names
+                ):
+                    continue
+                property = clazz.property_map.get(property_name)
+                if property is not None:
+                    property.is_synthesized = True
+
+    if decl_count == 0:
+        fail("Empty AST:", file_path)
+
+
+def emit_classes(file_path, namespace):
     classes = []
     for class_name in namespace.class_names():
         clazz = namespace.upsert_class(class_name)
@@ -589,6 +1153,13 @@ def emit_output(file_path, namespace):
             class_dict["super_class_name"] = clazz.super_class_name
         classes.append(class_dict)
 
+    return classes
+
+
+# The "enums" in each output are a snapshot of every enum seen so far in
+# the run, so enum declarations must be applied (in file order) before
+# emitting output.
+def emit_output(classes):
     enums = enum_type_map
 
     root = {
@@ -599,27 +1170,225 @@ def emit_output(file_path, namespace):
     return json.dumps(root, sort_keys=True, indent=4)
 
 
+# --- Include Paths
+
+
 # We need to include search paths for every
 # non-framework header.
-def find_header_include_paths(include_path):
-    result = []
-
-    def add_dir_if_has_header(dir_path):
-        # Only include subdirectories with header files.
-        for filename in os.listdir(dir_path):
-            if filename.endswith(".h"):
-                result.append("-I" + dir_path)
-                break
+#
+# Returns a list of (dir path, header filenames) for every directory with
+# headers, in include path order: the root, then the subdirectories of
+# each directory (top-down, in listing order). Each directory is listed
+# exactly once.
+def scan_header_dirs(include_path):
+    header_dirs = []
+    # Absolute dir path => mtime, for every directory listed.
+    dir_mtimes = {}
+
+    def scan_dir(dir_path):
+        dir_mtimes[os.path.abspath(dir_path)] = os.stat(dir_path).st_mtime_ns
+        subdir_entries = []
+        header_filenames = []
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.name.endswith(".h"):
+                    header_filenames.append(entry.name)
+                if entry.is_dir():
+                    subdir_entries.append(entry)
+        return subdir_entries, header_filenames
+
+    def walk_subdirs(subdir_entries):
+        children = []
+        for entry in subdir_entries:
+            dir_path = os.path.abspath(entry.path)
+            child_subdir_entries, header_filenames = scan_dir(dir_path)
+            if len(header_filenames) > 0:
+                header_dirs.append((dir_path, header_filenames))
+            # Like os.walk(), don't descend into symlinked directories.
+            if not entry.is_symlink():
+                children.append(child_subdir_entries)
+        for child_subdir_entries in children:
+            walk_subdirs(child_subdir_entries)
 
     # Add root if necessary.
-    add_dir_if_has_header(include_path)
+    subdir_entries, header_filenames = scan_dir(include_path)
+    if len(header_filenames) > 0:
+        header_dirs.append((include_path, header_filenames))
+    walk_subdirs(subdir_entries)
+
+    return header_dirs, dir_mtimes
+
+
+INCLUDE_PATHS_CACHE_VERSION = 1
+
+
+# A directory's mtime changes whenever an entry is added to, removed from
+# or renamed within it, so the scan can be reused as long as the mtimes
+# of all of the directories it listed are unchanged.
+def find_header_dirs(include_path, cache_dir_path=None):
+    if cache_dir_path is None:
+        header_dirs, _ = scan_header_dirs(include_path)
+        return header_dirs
+
+    cache_path = os.path.join(cache_dir_path, "header-dirs.json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "rt") as f:
+            json_data = json.load(f)
+        if (
+            json_data["version"] == INCLUDE_PATHS_CACHE_VERSION
+            and json_data["include_path"] == include_path
+            and json_data["abs_include_path"] == os.path.abspath(include_path)
+            and are_dir_mtimes_unchanged(json_data["dir_mtimes"])
+        ):
+            return [
+                (dir_path, header_filenames)
+                for dir_path, header_filenames in json_data["header_dirs"]
+            ]
+
+    header_dirs, dir_mtimes = scan_header_dirs(include_path)
+    json_data = {
+        "version": INCLUDE_PATHS_CACHE_VERSION,
+        "include_path": include_path,
+        "abs_include_path": os.path.abspath(include_path),
+        "header_dirs": header_dirs,
+        "dir_mtimes": dir_mtimes,
+    }
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "wt") as f:
+        json.dump(json_data, f)
+    os.replace(tmp_path, cache_path)
+    return header_dirs
+
+
+def are_dir_mtimes_unchanged(dir_mtimes):
+    for dir_path, mtime in dir_mtimes.items():
+        try:
+            if os.stat(dir_path).st_mtime_ns != mtime:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+# --- Header Maps
+
+# Rather than passing hundreds of -I flags, we can pass clang a single
+# header map (.hmap) that resolves every include those directories would
+# have resolved, e.g. "Foo.h" or "Sub/Foo.h", to the header's path.
+#
+# The format is defined by clang's HeaderMapImpl (see
+# clang/include/clang/Lex/HeaderMapTypes.h):
+#
+# * A header: magic, version, reserved, strings offset, entry count,
+#   bucket count (a power of two) and the length of the longest path.
+# * An open-addressed hash table of (key, prefix, suffix) buckets, each
+#   of which is an offset into the string pool. Offset 0 marks an empty
+#   bucket.
+# * The string pool of nul-terminated strings.
+HMAP_MAGIC = 0x686D6170  # 'hmap'
+HMAP_VERSION = 1
+HMAP_HEADER_FORMAT = "<IHHIIII"
+HMAP_BUCKET_FORMAT = "<III"
+
+
+def hash_header_map_key(key):
+    result = 0
+    for c in key.lower():
+        result = result + ord(c) * 13
+    return result & 0xFFFFFFFF
+
+
+# Returns a map of include name => (dir path, filename), in which the
+# first include path that can resolve a name wins, as it would for -I.
+def header_map_entries(header_dirs):
+    entries = {}
+    # Keys are case-insensitive.
+    lowercase_keys = set()
+    for include_dir_path, _ in header_dirs:
+        include_dir_prefix = os.path.join(include_dir_path, "")
+        for dir_path, header_filenames in header_dirs:
+            if dir_path != include_dir_path and not dir_path.startswith(
+                include_dir_prefix
+            ):
+                continue
+            for header_filename in header_filenames:
+                key = os.path.relpath(
+                    os.path.join(dir_path, header_filename), include_dir_path
+                )
+                if key.lower() in lowercase_keys:
+                    continue
+                lowercase_keys.add(key.lower())
+                entries[key] = (os.path.abspath(dir_path), header_filename)
+    return entries
+
+
+# Writes the header map to header_map_dir_path and returns its path.
+#
+# The map is named after a digest of its contents, so that the Obj-C parse
+# cache keys (which include the clang command) change whenever it does.
+def write_header_map(header_dirs, header_map_dir_path, name):
+    entries = header_map_entries(header_dirs)
+
+    bucket_count = 1
+    while bucket_count < len(entries) * 2:
+        bucket_count = bucket_count * 2
+
+    string_pool = bytearray(b"\0")
+    string_offsets = {}
+
+    def add_string(value):
+        offset = string_offsets.get(value)
+        if offset is None:
+            offset = len(string_pool)
+            string_pool.extend(value.encode("utf-8") + b"\0")
+            string_offsets[value] = offset
+        return offset
+
+    buckets = [(0, 0, 0)] * bucket_count
+    max_value_length = 0
+    for key, (dir_path, filename) in entries.items():
+        prefix = os.path.join(dir_path, "")
+        bucket = (add_string(key), add_string(prefix), add_string(filename))
+        max_value_length = max(max_value_length, len(prefix) + len(filename))
+
+        index = hash_header_map_key(key) & (bucket_count - 1)
+        while buckets[index][0] != 0:
+            index = (index + 1) & (bucket_count - 1)
+        buckets[index] = bucket
+
+    strings_offset = struct.calcsize(
+        HMAP_HEADER_FORMAT
+    ) + bucket_count * struct.calcsize(HMAP_BUCKET_FORMAT)
+    data = bytearray(
+        struct.pack(
+            HMAP_HEADER_FORMAT,
+            HMAP_MAGIC,
+            HMAP_VERSION,
+            0,
+            strings_offset,
+            len(entries),
+            bucket_count,
+            max_value_length,
+        )
+    )
+    for bucket in buckets:
+        data.extend(struct.pack(HMAP_BUCKET_FORMAT, *bucket))
+    data.extend(string_pool)
 
-    for rootdir, dirnames, filenames in os.walk(include_path):
-        for dirname in dirnames:
-            dir_path = os.path.abspath(os.path.join(rootdir, dirname))
-            add_dir_if_has_header(dir_path)
+    hmap_filename = "%s-%s.hmap" % (name, hashlib.sha256(data).hexdigest()[:16])
+    hmap_path = os.path.join(header_map_dir_path, hmap_filename)
+    if not os.path.exists(hmap_path):
+        tmp_path = hmap_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, hmap_path)
 
-    return result
+    # Remove any stale maps.
+    for filename in os.listdir(header_map_dir_path):
+        if filename != hmap_filename and filename.startswith(name + "-"):
+            os.remove(os.path.join(header_map_dir_path, filename))
+
+    return hmap_path
 
 
 # --- Modules
@@ -634,45 +1403,84 @@ def find_header_include_paths(include_path):
 #
 # #import <SignalServiceKit/OWSFailedAttachmentDownloadsJob.h>
 #
-# To simulate this, we walk the Pods directory and copy
+# To simulate this, we walk the Pods directory and link
 # headers into per-framework directories.
+#
+# With a cache dir, the framework directories persist across runs and
+# are updated incrementally: only links that are missing, stale or
+# point at the wrong header are touched. Links always resolve to the
+# current contents of their headers, so edits need no update at all.
 
 
-def copy_module_headers(src_dir_path, module_name, module_header_dir_path):
-    dst_dir_path = os.path.join(module_header_dir_path, module_name)
-    os.mkdir(dst_dir_path)
-
+# Returns a map of header filename to header path. Headers are
+# flattened into a single directory, so later headers with the same
+# filename win.
+def find_module_headers(src_dir_path):
+    header_map = {}
     for rootdir, dirnames, filenames in os.walk(src_dir_path):
         for filename in filenames:
             if not filename.endswith(".h"):
                 continue
             src_file_path = os.path.abspath(os.path.join(rootdir, filename))
-            dst_file_path = os.path.abspath(os.path.join(dst_dir_path, filename))
-            shutil.copyfile(src_file_path, dst_file_path)
+            header_map[filename] = src_file_path
+    return header_map
 
 
-def gather_pod_headers(pods_dir_path, module_header_dir_path):
+def gather_pod_headers(pods_dir_path, module_header_map):
 
     for dirname in os.listdir(pods_dir_path):
         src_dir_path = os.path.join(pods_dir_path, dirname)
         if not os.path.isdir(src_dir_path):
             continue
 
-        copy_module_headers(src_dir_path, dirname, module_header_dir_path)
+        module_header_map[dirname] = find_module_headers(src_dir_path)
 
 
-def gather_module_headers(pods_dir_path):
-    # Make a temp directory to gather framework headers in.
-    module_header_dir_path = tempfile.mkdtemp()
+def link_module_headers(module_header_map, module_header_dir_path):
+    for module_name in os.listdir(module_header_dir_path):
+        if module_name not in module_header_map:
+            shutil.rmtree(os.path.join(module_header_dir_path, module_name))
 
-    gather_pod_headers(pods_dir_path, module_header_dir_path)
+    for module_name, header_map in module_header_map.items():
+        dst_dir_path = os.path.join(module_header_dir_path, module_name)
+        os.makedirs(dst_dir_path, exist_ok=True)
+
+        linked_filenames = set()
+        for filename in os.listdir(dst_dir_path):
+            dst_file_path = os.path.join(dst_dir_path, filename)
+            if os.path.islink(dst_file_path) and os.readlink(
+                dst_file_path
+            ) == header_map.get(filename):
+                linked_filenames.add(filename)
+            else:
+                os.remove(dst_file_path)
+
+        for filename, src_file_path in header_map.items():
+            if filename in linked_filenames:
+                continue
+            os.symlink(src_file_path, os.path.join(dst_dir_path, filename))
+
+
+def gather_module_headers(pods_dir_path, cache_dir_path=None):
+    if cache_dir_path is None:
+        # Make a temp directory to gather framework headers in.
+        module_header_dir_path = tempfile.mkdtemp()
+        atexit.register(shutil.rmtree, module_header_dir_path, ignore_errors=True)
+    else:
+        module_header_dir_path = os.path.join(cache_dir_path, "module-headers")
+        os.makedirs(module_header_dir_path, exist_ok=True)
+
+    module_header_map = {}
+    gather_pod_headers(pods_dir_path, module_header_map)
 
     for project_name in (
         "SignalServiceKit",
         "Signal",
     ):
-        src_dir_path = os.path.join(git_repo_path, project_name)
-        copy_module_headers(src_dir_path, project_name, module_header_dir_path)
+        src_dir_path = os.path.join(sds_common.repo_root(), project_name)
+        module_header_map[project_name] = find_module_headers(src_dir_path)
+
+    link_module_headers(module_header_map, module_header_dir_path)
 
     return module_header_dir_path
 
@@ -681,6 +1489,7 @@ def gather_module_headers(pods_dir_path):
 
 
 def get_pch_include(file_path):
+    git_repo_path = sds_common.repo_root()
     ssk_path = os.path.join(git_repo_path, "SignalServiceKit") + os.sep
     s_path = os.path.join(git_repo_path, "Signal") + os.sep
     sae_path = os.path.join(git_repo_path, "SignalShareExtension") + os.sep
@@ -698,34 +1507,277 @@ def get_pch_include(file_path):
         fail("Couldn't determine .pch for file:", file_path)
 
 
+# Each prefix header is precompiled once per run, rather than parsed
+# again for every file. The PCHs are rebuilt on every run, because
+# they depend on every header they import.
+def precompiled_header_path(pch_dir_path, pch_include):
+    return os.path.join(pch_dir_path, os.path.basename(pch_include))
+
+
+def build_precompiled_header(
+    pch_include,
+    pch_dir_path,
+    iphoneos_sdk_path,
+    swift_bridging_path,
+    module_header_dir_path,
+    header_include_paths,
+):
+    pch_path = precompiled_header_path(pch_dir_path, pch_include)
+    if os.path.exists(pch_path):
+        os.remove(pch_path)
+
+    print("Precompiling:", sds_common.sds_to_relative_path(pch_include))
+    # clang can't resolve everything outside of XCode (see clang_command()),
+    # so the PCH has to be allowed to contain errors.
+    command = (
+        [
+            "clang",
+            "-x",
+            "objective-c-header",
+        ]
+        + clang_common_args(
+            iphoneos_sdk_path,
+            swift_bridging_path,
+            module_header_dir_path,
+            header_include_paths,
+        )
+        + [
+            "-Xclang",
+            "-fallow-pch-with-compiler-errors",
+            pch_include,
+            "-o",
+            pch_path,
+        ]
+    )
+    exit_code, output, error_output = ows_getoutput(command)
+    if not os.path.exists(pch_path):
+        print(error_output, file=sys.stderr)
+        fail("Could not precompile header:", pch_include)
+
+
+# --- Cache
+
+# Bump this whenever a change to this script changes what it emits,
+# so that stale cache entries are ignored.
+OBJC_CACHE_VERSION = 1
+
+
+# The parse results of each .m file are stored under a hash of everything
+# that goes into its clang invocation: the file, its .h, the prefix header,
+# the generated bridging headers and the clang args. Other headers imported
+# by the file aren't part of the key.
+class ObjcParseCache:
+    def __init__(self, cache_dir_path, swift_bridging_path):
+        self.dir_path = os.path.join(cache_dir_path, "objc")
+        os.makedirs(self.dir_path, exist_ok=True)
+        self.bridging_digest = sds_common.directory_digest(swift_bridging_path)
+
+    def key(self, file_path, command):
+        hasher = hashlib.sha256()
+
+        def add(value):
+            hasher.update(value.encode("utf-8"))
+            hasher.update(b"\0")
+
+        add(str(OBJC_CACHE_VERSION))
+        add(sds_common.sds_to_relative_path(file_path))
+        add(sds_common.file_digest(file_path))
+        h_file_path = os.path.splitext(file_path)[0] + ".h"
+        if os.path.exists(h_file_path):
+            add(sds_common.file_digest(h_file_path))
+        add(pch_digest(get_pch_include(file_path)))
+        add(self.bridging_digest)
+        for arg in command:
+            add(arg)
+        return hasher.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.dir_path, key + ".json")
+
+    def get(self, key):
+        entry_path = self.entry_path(key)
+        if not os.path.exists(entry_path):
+            return None
+        with open(entry_path, "rt") as f:
+            json_data = json.load(f)
+        enum_declarations = [tuple(value) for value in json_data["enum_declarations"]]
+        return json_data["classes"], enum_declarations
+
+    def set(self, key, classes, enum_declarations):
+        json_data = {
+            "classes": classes,
+            "enum_declarations": enum_declarations,
+        }
+        entry_path = self.entry_path(key)
+        tmp_path = entry_path + ".tmp"
+        with open(tmp_path, "wt") as f:
+            json.dump(json_data, f)
+        os.replace(tmp_path, entry_path)
+
+
+@functools.cache
+def pch_digest(pch_path):
+    return sds_common.file_digest(pch_path)
+
+
+# --- Prefilter
+
+# sds_generate.py only generates code for classes that descend from one of
+# these base classes.
+sds_base_model_class_names = ("TSYapDatabaseObject", "BaseModel")
+
+# The prefilter skips .m files that can't implement a model class, without
+# running clang. It decides from a lexical scan of each file (and its .h)
+# combined with the superclass of every class seen in the previous run, so
+# it only runs with a cache dir and does nothing on the first run.
+#
+# The scan errs on the side of parsing: files that implement a class whose
+# superclass is unknown are always parsed.
+OBJC_PREFILTER_VERSION = 1
+
+objc_interface_regex = re.compile(
+    r"^\s*@interface\s+(\w+)\s*(?:<[^>\n]*>\s*)?(?::\s*(\w+))?", re.MULTILINE
+)
+objc_implementation_regex = re.compile(r"^\s*@implementation\s+(\w+)", re.MULTILINE)
+
+
+def read_objc_source(file_path):
+    if not os.path.exists(file_path):
+        return ""
+    with open(file_path, "rt", errors="replace") as f:
+        return f.read()
+
+
+# Returns the names of the classes implemented by the file, and a list of
+# (class name, superclass name) pairs declared by it or its .h.
+def scan_objc_file(file_path):
+    m_text = read_objc_source(file_path)
+    h_text = read_objc_source(os.path.splitext(file_path)[0] + ".h")
+
+    implemented_class_names = objc_implementation_regex.findall(m_text)
+    super_class_pairs = []
+    for text in (h_text, m_text):
+        for class_name, super_class_name in objc_interface_regex.findall(text):
+            if super_class_name != "":
+                super_class_pairs.append((class_name, super_class_name))
+    return implemented_class_names, super_class_pairs
+
+
+class ObjcPrefilter:
+    def __init__(self, cache_dir_path):
+        self.state_path = os.path.join(cache_dir_path, "objc-prefilter.json")
+        # Class name => set of possible superclass names.
+        self.super_class_map = {}
+        self.has_state = False
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "rt") as f:
+                json_data = json.load(f)
+            if json_data.get("version") == OBJC_PREFILTER_VERSION:
+                for class_name, super_class_name in json_data["classes"].items():
+                    self.add_class(class_name, super_class_name)
+                self.has_state = True
+
+    def add_class(self, class_name, super_class_name):
+        super_class_names = self.super_class_map.setdefault(class_name, set())
+        if super_class_name is not None:
+            super_class_names.add(super_class_name)
+
+    def model_class_names(self):
+        result = set(sds_base_model_class_names)
+        did_change = True
+        while did_change:
+            did_change = False
+            for class_name, super_class_names in self.super_class_map.items():
+                if class_name in result:
+                    continue
+                if not super_class_names.isdisjoint(result):
+                    result.add(class_name)
+                    did_change = True
+        return result
+
+    def filter_file_paths(self, file_paths):
+        if not self.has_state:
+            return file_paths
+
+        scans = [scan_objc_file(file_path) for file_path in file_paths]
+        for _, super_class_pairs in scans:
+            for class_name, super_class_name in super_class_pairs:
+                self.add_class(class_name, super_class_name)
+        model_class_names = self.model_class_names()
+
+        def can_contain_model(implemented_class_names):
+            for class_name in implemented_class_names:
+                if class_name in model_class_names:
+                    return True
+                if class_name not in self.super_class_map:
+                    return True
+            return False
+
+        result = [
+            file_path
+            for file_path, (implemented_class_names, _) in zip(file_paths, scans)
+            if can_contain_model(implemented_class_names)
+        ]
+        skipped_count = len(file_paths) - len(result)
+        print(
+            f"Skipping {skipped_count} / {len(file_paths)} files that can't contain SDS models"
+        )
+        return result
+
+    # Records the classes from this run, keeping those from files that
+    # were skipped.
+    def save(self, results):
+        classes = {}
+        for class_name, super_class_names in self.super_class_map.items():
+            classes[class_name] = min(super_class_names, default=None)
+        for result in results:
+            if result is None:
+                continue
+            for class_dict in result[0]:
+                classes[class_dict["name"]] = class_dict.get("super_class_name")
+
+        json_data = {
+            "version": OBJC_PREFILTER_VERSION,
+            "classes": classes,
+        }
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "wt") as f:
+            json.dump(json_data, f, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+
 # --- Processing
 
 
-def process_objc(
-    file_path: str,
+objc_backends = ("text", "json", "libclang")
+
+# clang's -ast-dump option for each backend that parses a dump.
+ast_dump_options = {
+    "text": "-ast-dump",
+    "json": "-ast-dump=json",
+}
+# Declarations deserialized from a PCH are only dumped with -ast-dump-all.
+ast_dump_all_options = {
+    "text": "-ast-dump-all",
+    "json": "-ast-dump-all=json",
+}
+
+
+# The args shared by every clang invocation, including those that
+# build PCHs.
+def clang_common_args(
     iphoneos_sdk_path: str,
     swift_bridging_path: str,
     module_header_dir_path: str,
     header_include_paths: list[str],
-) -> None:
-    pch_include = get_pch_include(file_path)
-
+) -> list[str]:
     # These clang args can be found by building our workspace and looking at how XCode invokes clang.
     clang_args = "-arch arm64 -fmessage-length=0 -fdiagnostics-show-note-include-stack -fmacro-backtrace-limit=0 -std=gnu11 -fobjc-arc -fobjc-weak -fmodules -gmodules -fmodules-prune-interval=86400 -fmodules-prune-after=345600 -Wnon-modular-include-in-framework-module -Werror=non-modular-include-in-framework-module -fapplication-extension -Wno-trigraphs -fpascal-strings -O0 -fno-common -Wno-missing-field-initializers -Wno-missing-prototypes -Werror=return-type -Wdocumentation -Wunreachable-code -Wno-implicit-atomic-properties -Werror=deprecated-objc-isa-usage -Wno-objc-interface-ivars -Werror=objc-root-class -Wno-arc-repeated-use-of-weak -Wimplicit-retain-self -Wduplicate-method-match -Wno-missing-braces -Wparentheses -Wswitch -Wunused-function -Wno-unused-label -Wno-unused-parameter -Wunused-variable -Wunused-value -Wempty-body -Wuninitialized -Wconditional-uninitialized -Wno-unknown-pragmas -Wno-shadow -Wno-four-char-constants -Wno-conversion -Wconstant-conversion -Wint-conversion -Wbool-conversion -Wenum-conversion -Wno-float-conversion -Wnon-literal-null-conversion -Wobjc-literal-conversion -Wshorten-64-to-32 -Wpointer-sign -Wno-newline-eof -Wno-selector -Wno-strict-selector-match -Wundeclared-selector -Wdeprecated-implementations".split(
         " "
     )
 
-    # TODO: We'll never repro the correct search paths, so clang will always emit errors.
-    #       We'll want to ignore these errors without silently failing.
-    command = (
-        [
-            "clang",
-            "-x",
-            "objective-c",
-            "-Xclang",
-            "-ast-dump",
-            "-fobjc-arc",
-        ]
+    return (
+        ["-fobjc-arc"]
         + clang_args
         + [
             "-isysroot",
@@ -735,69 +1787,369 @@ def process_objc(
         + [
             ("-I" + module_header_dir_path),
             ("-I" + swift_bridging_path),
+        ]
+    )
+
+
+def clang_command(
+    file_path: str,
+    backend: str,
+    pch_dir_path: str,
+    iphoneos_sdk_path: str,
+    swift_bridging_path: str,
+    module_header_dir_path: str,
+    header_include_paths: list[str],
+) -> list[str]:
+    pch_include = get_pch_include(file_path)
+    if pch_dir_path is None:
+        ast_dump_option = ast_dump_options.get(backend)
+        pch_args = [
             "-include",
             pch_include,
+        ]
+    else:
+        ast_dump_option = ast_dump_all_options.get(backend)
+        pch_args = [
+            "-Xclang",
+            "-fallow-pch-with-compiler-errors",
+            "-include-pch",
+            precompiled_header_path(pch_dir_path, pch_include),
+        ]
+
+    # TODO: We'll never repro the correct search paths, so clang will always emit errors.
+    #       We'll want to ignore these errors without silently failing.
+    if backend == "libclang":
+        ast_dump_args = []
+    else:
+        ast_dump_args = [
+            "-Xclang",
+            ast_dump_option,
+        ]
+
+    command = (
+        [
+            "clang",
+            "-x",
+            "objective-c",
+        ]
+        + ast_dump_args
+        + clang_common_args(
+            iphoneos_sdk_path,
+            swift_bridging_path,
+            module_header_dir_path,
+            header_include_paths,
+        )
+        + pch_args
+        + [
             file_path,
         ]
     )
+    return command
 
-    exit_code, output, error_output = ows_getoutput(command)
 
-    output = output.strip()
-    raw_ast = output
+def process_objc(
+    file_path: str,
+    backend: str,
+    pch_dir_path: str,
+    iphoneos_sdk_path: str,
+    swift_bridging_path: str,
+    module_header_dir_path: str,
+    header_include_paths: list[str],
+    metrics: dict = None,
+) -> tuple[list[dict], list[tuple]]:
+    start_time = time.perf_counter()
+    command = clang_command(
+        file_path,
+        backend,
+        pch_dir_path,
+        iphoneos_sdk_path,
+        swift_bridging_path,
+        module_header_dir_path,
+        header_include_paths,
+    )
 
     namespace = Namespace()
+    project_dir_paths = [sds_common.repo_root(), module_header_dir_path]
+
+    if backend == "libclang":
+        process_objc_libclang(namespace, file_path, command, project_dir_paths, metrics)
+        classes = emit_classes(file_path, namespace)
+        if metrics is not None:
+            seconds = time.perf_counter() - start_time
+            metrics["seconds"] = seconds
+            metrics["parse_seconds"] = seconds - metrics["subprocess_seconds"]
+            add_class_metrics(metrics, classes)
+        return classes, namespace.enum_declarations
+
+    # Parse the AST as clang emits it, rather than buffering the whole dump.
+    # clang's diagnostics are discarded; see clang_command().
+    proc = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    ast_lines = proc.stdout
+    if metrics is not None:
+        ast_lines = MeteredLines(ast_lines)
+    try:
+        if backend == "json":
+            process_objc_json_ast(namespace, file_path, ast_lines, project_dir_paths)
+        else:
+            process_objc_ast(namespace, file_path, ast_lines)
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+    subprocess_end_time = time.perf_counter()
+
+    classes = emit_classes(file_path, namespace)
+    if metrics is not None:
+        # clang and the parser run concurrently, so the parse time is
+        # whatever wasn't spent waiting for clang's output.
+        seconds = time.perf_counter() - start_time
+        metrics["seconds"] = seconds
+        metrics["subprocess_seconds"] = subprocess_end_time - start_time
+        metrics["parse_seconds"] = seconds - ast_lines.wait_seconds
+        metrics["ast_bytes"] = ast_lines.byte_count
+        add_class_metrics(metrics, classes)
+    return classes, namespace.enum_declarations
+
+
+# Iterates over the lines of clang's output, recording how long was spent
+# waiting for each line and how much output there was.
+class MeteredLines:
+    def __init__(self, lines):
+        self.lines = lines
+        self.wait_seconds = 0
+        self.byte_count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start_time = time.perf_counter()
+        try:
+            line = next(self.lines)
+        finally:
+            self.wait_seconds += time.perf_counter() - start_time
+        self.byte_count += len(line)
+        return line
 
-    process_objc_ast(namespace, file_path, raw_ast)
 
-    output = emit_output(file_path, namespace)
+def add_class_metrics(metrics, classes):
+    metrics["class_count"] = len(classes)
+    metrics["property_count"] = sum(
+        len(class_dict["properties"]) for class_dict in classes
+    )
+
+
+def write_output(file_path, classes):
+    output = emit_output(classes)
 
     parsed_file_path = file_path + sds_common.SDS_JSON_FILE_EXTENSION
     with open(parsed_file_path, "wt") as f:
         f.write(output)
+    return parsed_file_path
+
+
+# Lists the .sdsjson files written for src_path in the manifest, along with
+# any that earlier runs wrote for other paths.
+def update_sds_json_manifest(cache_dir_path, src_path, output_file_paths):
+    manifest = sds_common.load_sds_json_manifest(cache_dir_path)
+    file_paths, dir_paths = manifest if manifest is not None else ([], [])
+    src_dir_prefix = src_path + os.sep
+    file_paths = [
+        file_path
+        for file_path in file_paths
+        if file_path not in output_file_paths
+        and not file_path.startswith(src_dir_prefix)
+    ]
+    dir_paths = set(
+        dir_path
+        for dir_path in dir_paths
+        if dir_path != src_path and not dir_path.startswith(src_dir_prefix)
+    )
+    if os.path.isdir(src_path):
+        for rootdir, dirnames, filenames in os.walk(src_path):
+            dir_paths.add(rootdir)
+    else:
+        dir_paths.add(os.path.dirname(src_path))
+    sds_common.write_sds_json_manifest(
+        cache_dir_path, file_paths + output_file_paths, dir_paths
+    )
 
 
-def process_file(
-    file_path,
-    iphoneos_sdk_path,
-    swift_bridging_path,
-    module_header_dir_path,
-    header_include_paths,
-):
+def should_process_file(file_path):
     filename = os.path.basename(file_path)
 
     # TODO: Fix this file
     if filename == "OWSDisappearingMessageFinderTest.m":
-        return
+        return False
 
     _, file_extension = os.path.splitext(filename)
-    if file_extension == ".m":
-        process_objc(
-            file_path,
-            iphoneos_sdk_path,
-            swift_bridging_path,
-            module_header_dir_path,
-            header_include_paths,
+    return file_extension == ".m"
+
+
+def process_objc_job(args, is_timing_enabled, file_path):
+    # Runs in a worker process; failures are reported back to the parent
+    # rather than raised, so that one bad file doesn't abort the run.
+    metrics = {} if is_timing_enabled else None
+    try:
+        return process_objc(file_path, *args, metrics), metrics, None
+    except Exception:
+        return None, metrics, traceback.format_exc()
+
+
+def process_files(
+    file_paths,
+    jobs,
+    cache,
+    prefilter,
+    backend,
+    pch_dir_path,
+    iphoneos_sdk_path,
+    swift_bridging_path,
+    module_header_dir_path,
+    header_include_paths,
+    should_write_outputs,
+    timing,
+):
+    file_paths = [
+        file_path for file_path in file_paths if should_process_file(file_path)
+    ]
+    if prefilter is not None:
+        with timing.stage("prefilter"):
+            file_paths = prefilter.filter_file_paths(file_paths)
+    args = (
+        backend,
+        pch_dir_path,
+        iphoneos_sdk_path,
+        swift_bridging_path,
+        module_header_dir_path,
+        header_include_paths,
+    )
+
+    # Results for each file, in file order; None until parsed.
+    results = [None] * len(file_paths)
+    cache_keys = [None] * len(file_paths)
+    if cache is not None:
+        with timing.stage("cache lookup"):
+            for index, file_path in enumerate(file_paths):
+                # The module header dir only holds links to headers, which
+                # are left out of the key like other imported headers.
+                command = clang_command(
+                    file_path,
+                    backend,
+                    pch_dir_path,
+                    iphoneos_sdk_path,
+                    swift_bridging_path,
+                    "",
+                    header_include_paths,
+                )
+                cache_keys[index] = cache.key(file_path, command)
+                results[index] = cache.get(cache_keys[index])
+                if results[index] is not None:
+                    classes, _ = results[index]
+                    metrics = {"cache_hit_count": 1}
+                    add_class_metrics(metrics, classes)
+                    timing.add_file_metrics(file_path, metrics)
+        hit_count = len([result for result in results if result is not None])
+        print(f"Reusing cached results for {hit_count} / {len(file_paths)} files")
+
+    def did_parse(index, result, metrics):
+        results[index] = result
+        if metrics is not None:
+            timing.add_file_metrics(file_paths[index], metrics)
+        if cache is not None:
+            cache.set(cache_keys[index], *result)
+
+    missing_indices = [index for index, result in enumerate(results) if result is None]
+
+    # Only precompile the prefix headers of files that need parsing.
+    if pch_dir_path is not None:
+        pch_includes = set(
+            get_pch_include(file_paths[index]) for index in missing_indices
         )
+        with timing.stage("precompile headers"):
+            for pch_include in sorted(pch_includes):
+                build_precompiled_header(
+                    pch_include,
+                    pch_dir_path,
+                    iphoneos_sdk_path,
+                    swift_bridging_path,
+                    module_header_dir_path,
+                    header_include_paths,
+                )
+    failed_file_paths = []
+    with timing.stage("parse"):
+        if jobs <= 1:
+            for index in missing_indices:
+                metrics = {} if timing.enabled else None
+                result = process_objc(file_paths[index], *args, metrics)
+                did_parse(index, result, metrics)
+        else:
+            # Workers only run clang and parse the AST. Outputs are written
+            # below, in the same order as a serial run, so that every .sdsjson
+            # is identical.
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                job_results = executor.map(
+                    functools.partial(process_objc_job, args, timing.enabled),
+                    [file_paths[index] for index in missing_indices],
+                )
+                for index, (result, metrics, error) in zip(
+                    missing_indices, job_results
+                ):
+                    if error is not None:
+                        print("Could not parse:", file_paths[index], file=sys.stderr)
+                        print(error, file=sys.stderr)
+                        failed_file_paths.append(file_paths[index])
+                        continue
+                    did_parse(index, result, metrics)
 
+    classes = []
+    output_file_paths = []
+    with timing.stage("write outputs"):
+        for file_path, result in zip(file_paths, results):
+            if result is None:
+                continue
+            file_classes, enum_declarations = result
+            apply_enum_declarations(enum_declarations)
+            if should_write_outputs:
+                output_file_paths.append(write_output(file_path, file_classes))
+            classes.extend(file_classes)
 
-# ---
+        if prefilter is not None:
+            prefilter.save(results)
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Parse Objective-C AST.")
-    parser.add_argument(
-        "--src-path", required=True, help="used to specify a path to process."
-    )
-    parser.add_argument(
-        "--swift-bridging-path",
-        required=True,
-        help="used to specify a path to process.",
-    )
-    args = parser.parse_args()
+    if len(failed_file_paths) > 0:
+        fail("Could not parse %d file(s):" % len(failed_file_paths), *failed_file_paths)
 
-    src_path = os.path.abspath(args.src_path)
-    swift_bridging_path = os.path.abspath(args.swift_bridging_path)
-    module_header_dir_path = gather_module_headers("Pods")
+    return classes, output_file_paths
+
+
+# Parses the .m files in src_path, and returns a dict for each class, in
+# file order. The enums are gathered in enum_type_map.
+#
+# The classes in each file are also written to a .sdsjson file alongside
+# it if should_write_outputs is set, for sds_generate.py, and listed in the
+# manifest in the cache dir.
+def parse_objc_files(
+    src_path,
+    swift_bridging_path,
+    jobs,
+    cache_dir_path,
+    backend,
+    should_use_pch,
+    should_use_header_map,
+    should_prefilter,
+    should_write_outputs,
+    timing,
+):
+    src_path = os.path.abspath(src_path)
+    swift_bridging_path = os.path.abspath(swift_bridging_path)
+    if cache_dir_path is not None:
+        cache_dir_path = os.path.abspath(cache_dir_path)
+    with timing.stage("gather module headers"):
+        module_header_dir_path = gather_module_headers("Pods", cache_dir_path)
 
     command = [
         "xcrun",
@@ -805,13 +2157,27 @@ if __name__ == "__main__":
         "--sdk",
         "iphoneos",
     ]
-    exit_code, output, error_output = ows_getoutput(command)
+    with timing.stage("find sdk"):
+        exit_code, output, error_output = ows_getoutput(command)
     if int(exit_code) != 0:
         fail("Could not find iOS SDK.")
     iphoneos_sdk_path = output.strip()
 
-    header_include_paths = []
-    header_include_paths.extend(find_header_include_paths("SignalServiceKit"))
+    with timing.stage("find header include paths"):
+        header_dirs = find_header_dirs("SignalServiceKit", cache_dir_path)
+    if should_use_header_map:
+        if cache_dir_path is not None:
+            header_map_dir_path = os.path.join(cache_dir_path, "header-maps")
+            os.makedirs(header_map_dir_path, exist_ok=True)
+        else:
+            header_map_dir_path = tempfile.mkdtemp()
+            atexit.register(shutil.rmtree, header_map_dir_path, ignore_errors=True)
+        header_map_path = write_header_map(
+            header_dirs, header_map_dir_path, "SignalServiceKit"
+        )
+        header_include_paths = ["-I" + header_map_path]
+    else:
+        header_include_paths = ["-I" + dir_path for dir_path, _ in header_dirs]
 
     # SDS code generation uses clang to parse the AST of Objective-C files.
     # We're parsing these files outside the context of an XCode workspace,
@@ -823,11 +2189,13 @@ if __name__ == "__main__":
     # * .pch files.
 
     print(f"Parsing Obj-C files in {src_path}...")
+    prefilter = None
     if os.path.isfile(src_path):
-        process_file(
-            src_path, iphoneos_sdk_path, swift_bridging_path, module_header_dir_path
-        )
+        file_paths = [src_path]
     else:
+        if cache_dir_path is not None and should_prefilter:
+            prefilter = ObjcPrefilter(cache_dir_path)
+
         # First clear out existing .sdsjson files.
         for rootdir, dirnames, filenames in os.walk(src_path):
             for filename in filenames:
@@ -835,16 +2203,126 @@ if __name__ == "__main__":
                     file_path = os.path.abspath(os.path.join(rootdir, filename))
                     os.remove(file_path)
 
+        file_paths = []
         for rootdir, dirnames, filenames in os.walk(src_path):
             for filename in filenames:
-                file_path = os.path.abspath(os.path.join(rootdir, filename))
-                process_file(
-                    file_path,
-                    iphoneos_sdk_path,
-                    swift_bridging_path,
-                    module_header_dir_path,
-                    header_include_paths,
-                )
+                file_paths.append(os.path.abspath(os.path.join(rootdir, filename)))
+
+    cache = None
+    if cache_dir_path is not None:
+        cache = ObjcParseCache(cache_dir_path, swift_bridging_path)
+
+    pch_dir_path = None
+    if not should_use_pch:
+        pass
+    elif backend == "libclang":
+        # PCHs are built by the clang executable, whose version may not
+        # match libclang's.
+        pass
+    elif cache_dir_path is not None:
+        pch_dir_path = os.path.join(cache_dir_path, "pch")
+        os.makedirs(pch_dir_path, exist_ok=True)
+    else:
+        pch_dir_path = tempfile.mkdtemp()
+        atexit.register(shutil.rmtree, pch_dir_path, ignore_errors=True)
+
+    classes, output_file_paths = process_files(
+        file_paths,
+        jobs,
+        cache,
+        prefilter,
+        backend,
+        pch_dir_path,
+        iphoneos_sdk_path,
+        swift_bridging_path,
+        module_header_dir_path,
+        header_include_paths,
+        should_write_outputs,
+        timing,
+    )
+
+    if cache_dir_path is not None:
+        if should_write_outputs:
+            update_sds_json_manifest(cache_dir_path, src_path, output_file_paths)
+        else:
+            # The .sdsjson files for src_path were cleared out above.
+            sds_common.delete_sds_json_manifest(cache_dir_path)
+
+    return classes
+
+
+# ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse Objective-C AST.")
+    parser.add_argument(
+        "--src-path", required=True, help="used to specify a path to process."
+    )
+    parser.add_argument(
+        "--swift-bridging-path",
+        required=True,
+        help="used to specify a path to process.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of files to parse in parallel.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="path of a directory in which to cache parse results across runs.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=objc_backends,
+        default="text",
+        help="how to parse files: clang's text or JSON AST dump, or in-process with the libclang Python bindings (set SDS_LIBCLANG_PATH to choose the libclang library).",
+    )
+    parser.add_argument(
+        "--no-pch",
+        action="store_true",
+        help="include prefix headers in each file rather than precompiling them.",
+    )
+    parser.add_argument(
+        "--header-map",
+        action="store_true",
+        help="pass clang a header map rather than an -I flag for every directory with headers.",
+    )
+    parser.add_argument(
+        "--no-prefilter",
+        action="store_true",
+        help="parse every file, even those that can't contain SDS models.",
+    )
+    parser.add_argument(
+        "--repo-root",
+        help="path of the repo's root dir. By default, it's found from the current dir.",
+    )
+    parser.add_argument(
+        "--timing-report",
+        help="path of a JSON file in which to record per-file and per-stage timings.",
+    )
+    args = parser.parse_args()
+
+    if args.repo_root is not None:
+        sds_common.set_repo_root(args.repo_root)
+
+    timing = sds_common.TimingReport("sds_parse_objc", args.timing_report)
+
+    parse_objc_files(
+        args.src_path,
+        args.swift_bridging_path,
+        args.jobs,
+        args.cache_dir,
+        args.backend,
+        not args.no_pch,
+        args.header_map,
+        not args.no_prefilter,
+        True,
+        timing,
+    )
+
+    timing.finish()
 
 
 # TODO: We can't access ivars from Swift without public property accessors.
@@ -5,12 +5,14 @@ import sys
 import subprocess
 import datetime
 import argparse
+import concurrent.futures
+import functools
 import re
 import json
 import sds_common
 from sds_common import fail
 import tempfile
-import shutil
+import time
 
 
 # We need to generate fake -Swift.h bridging headers that declare the Swift
@@ -81,13 +83,17 @@ def parse_swift_ast(file_path, namespace, ast):
             namespace.swift_class_names.append(name)
 
 
-def process_file(file_path, namespace):
+def should_process_file(file_path):
     filename = os.path.basename(file_path)
     if not filename.endswith(".swift"):
-        return
+        return False
     if filename == "EmojiWithSkinTones+String.swift":
-        return
+        return False
+    return True
+
 
+# Runs on a worker thread.
+def run_sourcekitten(file_path):
     command = ["sourcekitten", "structure", "--file", file_path]
     # for part in command:
     #     print '\t', part
@@ -97,7 +103,9 @@ def process_file(file_path, namespace):
 
     # command = ' '.join(command).strip()
     # print 'command', command
+    start_time = time.perf_counter()
     exit_code, output, error_output = ows_getoutput(command)
+    subprocess_end_time = time.perf_counter()
     if exit_code != 0:
         print("exit_code:", exit_code)
         fail("Are you missing sourcekitten? Install with homebrew?")
@@ -110,14 +118,341 @@ def process_file(file_path, namespace):
     output = output.strip()
     # print 'output', output
 
-    parse_swift_ast(file_path, namespace, output)
+    return output, subprocess_end_time - start_time
+
+
+# --- Scanner
+
+# A pure-Python alternative to sourcekitten. parse_swift_ast() only needs
+# the names of top-level classes and protocols, so rather than parsing
+# Swift, we tokenize just enough of it to skip comments, string literals
+# (including multi-line, raw and interpolated strings) and the bodies of
+# declarations.
+#
+# Files that can't be scanned confidently are flagged as ambiguous, and
+# are parsed with sourcekitten instead.
+
+
+class AmbiguousSwiftSource(Exception):
+    pass
+
+
+swift_token_regex = re.compile(
+    r"""
+    (?P<line_comment>//)
+    | (?P<block_comment>/\*)
+    | (?P<string>(?P<hashes>\#*)(?P<quotes>\"\"\"|\"))
+    | (?P<regex>\#+/)
+    | (?P<attribute>@\w+)
+    | (?P<identifier>[^\W\d]\w*|`[^`\n]*`)
+    | (?P<punctuation>[{}():,])
+    """,
+    re.VERBOSE,
+)
+swift_block_comment_regex = re.compile(r"/\*|\*/")
+swift_objc_name_regex = re.compile(r"\(\s*([^\W\d]\w*)\s*\)")
+
+# Keywords that begin declarations other than classes and protocols.
+swift_other_declaration_keywords = {
+    "actor",
+    "enum",
+    "extension",
+    "func",
+    "import",
+    "init",
+    "let",
+    "macro",
+    "operator",
+    "precedencegroup",
+    "struct",
+    "subscript",
+    "typealias",
+    "var",
+}
+
+
+# Returns the next token at or after pos, as (kind, text, end pos), or
+# None at the end of the source. Comments and string literals are skipped.
+def next_swift_token(source, pos):
+    while True:
+        match = swift_token_regex.search(source, pos)
+        if match is None:
+            return None
+        kind = match.lastgroup
+        pos = match.end()
+        if kind == "line_comment":
+            pos = source.find("\n", pos)
+            if pos < 0:
+                return None
+        elif kind == "block_comment":
+            pos = skip_swift_block_comment(source, pos)
+        elif kind == "string":
+            pos = skip_swift_string(
+                source, pos, match.group("hashes"), match.group("quotes")
+            )
+        elif kind == "regex":
+            raise AmbiguousSwiftSource("regex literal")
+        else:
+            return kind, match.group(), pos
+
+
+def skip_swift_block_comment(source, pos):
+    # Block comments nest.
+    depth = 1
+    while depth > 0:
+        match = swift_block_comment_regex.search(source, pos)
+        if match is None:
+            raise AmbiguousSwiftSource("unterminated comment")
+        if match.group() == "/*":
+            depth = depth + 1
+        else:
+            depth = depth - 1
+        pos = match.end()
+    return pos
+
+
+# Matches an escape (which may begin an interpolation), the closing
+# delimiter or, for single-line strings, a newline.
+@functools.cache
+def swift_string_regex(hashes, quotes):
+    pattern = re.escape("\\" + hashes) + "|" + re.escape(quotes + hashes)
+    if quotes == '"':
+        pattern = pattern + "|\n"
+    return re.compile(pattern)
+
+
+def skip_swift_string(source, pos, hashes, quotes):
+    regex = swift_string_regex(hashes, quotes)
+    escape = "\\" + hashes
+    while True:
+        match = regex.search(source, pos)
+        if match is None or match.group() == "\n":
+            raise AmbiguousSwiftSource("unterminated string")
+        pos = match.end()
+        if match.group() != escape:
+            return pos
+        if source.startswith("(", pos):
+            pos = skip_swift_interpolation(source, pos + 1)
+        else:
+            # Skip the escaped character.
+            pos = pos + 1
+
+
+def skip_swift_interpolation(source, pos):
+    depth = 1
+    while depth > 0:
+        token = next_swift_token(source, pos)
+        if token is None:
+            raise AmbiguousSwiftSource("unterminated interpolation")
+        _, text, pos = token
+        if text == "(":
+            depth = depth + 1
+        elif text == ")":
+            depth = depth - 1
+    return pos
+
+
+# Returns the top-level declarations in Swift source, as a list of
+# ("class" or "protocol", name), in source order. Like parse_swift_ast(),
+# names are Obj-C runtime names where they're specified with @objc(...).
+def scan_swift_source(source):
+    declarations = []
+    brace_depth = 0
+    paren_depth = 0
+    # The name from an @objc(...) attribute on the next declaration.
+    objc_name = None
+    previous_text = None
+    pos = 0
+    while True:
+        token = next_swift_token(source, pos)
+        if token is None:
+            break
+        kind, text, pos = token
+        # e.g. "protocol Foo: class, Bar" or "where T: class, U: Bar".
+        is_in_type_list = previous_text in (":", ",")
+        previous_text = text
+        if text == "{":
+            brace_depth = brace_depth + 1
+            objc_name = None
+        elif text == "}":
+            brace_depth = brace_depth - 1
+            if brace_depth < 0:
+                raise AmbiguousSwiftSource("unbalanced braces")
+        elif text == "(":
+            paren_depth = paren_depth + 1
+        elif text == ")":
+            paren_depth = paren_depth - 1
+            if paren_depth < 0:
+                raise AmbiguousSwiftSource("unbalanced parentheses")
+        elif brace_depth > 0 or paren_depth > 0:
+            continue
+        elif text == "@objc":
+            match = swift_objc_name_regex.match(source, pos)
+            if match is not None:
+                objc_name = match.group(1)
+                pos = match.end()
+            elif source.startswith("(", pos):
+                raise AmbiguousSwiftSource("unexpected @objc attribute")
+        elif text == "class" and is_in_type_list:
+            # A class constraint, rather than a declaration.
+            continue
+        elif kind == "identifier" and text in ("class", "protocol"):
+            token = next_swift_token(source, pos)
+            if token is not None and token[0] == "identifier":
+                _, name, pos = token
+                if name.startswith("`"):
+                    raise AmbiguousSwiftSource("quoted name")
+                if objc_name is not None and not objc_name.startswith("_"):
+                    name = objc_name
+                if not name.startswith("_"):
+                    declarations.append((text, name))
+            objc_name = None
+        elif kind == "identifier" and text in swift_other_declaration_keywords:
+            objc_name = None
+    if brace_depth != 0 or paren_depth != 0:
+        raise AmbiguousSwiftSource("unbalanced braces")
+    return declarations
+
+
+# --- Cache
+
+SWIFT_CACHE_VERSION = 2
+
+
+# Caches the declarations found in each Swift file across runs.
+#
+# Entries are keyed by each file's path and a digest of its contents.
+# Each file's size and mtime are recorded too, so that an unchanged file
+# can be recognized with a stat() rather than by reading it.
+class SwiftDeclarationCache:
+    def __init__(self, cache_dir_path, backend):
+        self.cache_path = os.path.join(cache_dir_path, "swift-declarations.json")
+        self.start_time_ns = time.time_ns()
+        self.backend = backend
+        self.entries = {}
+        self.last_start_time_ns = 0
+        if os.path.exists(self.cache_path):
+            with open(self.cache_path, "rt") as f:
+                json_data = json.load(f)
+            if (
+                json_data["version"] == SWIFT_CACHE_VERSION
+                and json_data["backend"] == backend
+            ):
+                self.entries = json_data["files"]
+                self.last_start_time_ns = json_data["start_time_ns"]
+        # Entries for this run's files. Those of deleted files are dropped.
+        self.new_entries = {}
+
+    # Returns a Namespace with the file's cached declarations, or None.
+    def get(self, file_path):
+        relative_path = sds_common.sds_to_relative_path(file_path)
+        stat = os.stat(file_path)
+        entry = self.entries.get(relative_path)
+        # A file that was modified around the time of the last run may have
+        # changed again since, without changing its mtime.
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and stat.st_mtime_ns < self.last_start_time_ns - 2 * 1000 * 1000 * 1000
+        ):
+            digest = entry["digest"]
+        else:
+            digest = sds_common.file_digest(file_path)
+
+        new_entry = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "digest": digest,
+        }
+        self.new_entries[relative_path] = new_entry
+        if entry is None or entry["digest"] != digest:
+            return None
+
+        new_entry["protocol_names"] = entry["protocol_names"]
+        new_entry["class_names"] = entry["class_names"]
+        file_namespace = Namespace()
+        file_namespace.swift_protocol_names = list(entry["protocol_names"])
+        file_namespace.swift_class_names = list(entry["class_names"])
+        return file_namespace
+
+    # Must follow a call to get() for the same file.
+    def set(self, file_path, file_namespace):
+        new_entry = self.new_entries[sds_common.sds_to_relative_path(file_path)]
+        new_entry["protocol_names"] = file_namespace.swift_protocol_names
+        new_entry["class_names"] = file_namespace.swift_class_names
+
+    def save(self):
+        json_data = {
+            "version": SWIFT_CACHE_VERSION,
+            "backend": self.backend,
+            "start_time_ns": self.start_time_ns,
+            "files": {
+                relative_path: entry
+                for relative_path, entry in self.new_entries.items()
+                if "class_names" in entry
+            },
+        }
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "wt") as f:
+            json.dump(json_data, f)
+        os.replace(tmp_path, self.cache_path)
 
 
+# ---
+
+
+swift_backends = ("sourcekitten", "scanner")
+
+
+# Runs on a worker thread. Returns a Namespace with the file's
+# declarations, and the file's metrics.
+def process_file(file_path, backend):
+    start_time = time.perf_counter()
+    file_namespace = Namespace()
+
+    if backend == "scanner":
+        try:
+            with open(file_path, "rt", encoding="utf-8") as f:
+                declarations = scan_swift_source(f.read())
+        except (AmbiguousSwiftSource, UnicodeDecodeError) as error:
+            relative_path = sds_common.sds_to_relative_path(file_path)
+            print(f"Parsing {relative_path} with sourcekitten: {error}")
+        else:
+            for kind, name in declarations:
+                if kind == "protocol":
+                    file_namespace.swift_protocol_names.append(name)
+                else:
+                    file_namespace.swift_class_names.append(name)
+            seconds = time.perf_counter() - start_time
+            return file_namespace, {
+                "seconds": seconds,
+                "parse_seconds": seconds,
+            }
+
+    output, subprocess_seconds = run_sourcekitten(file_path)
+    parse_start_time = time.perf_counter()
+    parse_swift_ast(file_path, file_namespace, output)
+    end_time = time.perf_counter()
+    metrics = {
+        "seconds": end_time - start_time,
+        "subprocess_seconds": subprocess_seconds,
+        "parse_seconds": end_time - parse_start_time,
+        "ast_bytes": len(output),
+    }
+    if backend == "scanner":
+        metrics["sourcekitten_fallback_count"] = 1
+    return file_namespace, metrics
+
+
+# Returns True if a header was generated. The header's declarations are
+# sorted, and it's only written if it has changed, so that the clang
+# invocations that include it can reuse their caches.
 def generate_swift_bridging_header(namespace, swift_bridging_path):
 
     output = []
 
-    for name in namespace.swift_protocol_names:
+    for name in sorted(set(namespace.swift_protocol_names)):
         output.append(
             """
 @protocol %s
@@ -126,7 +461,7 @@ def generate_swift_bridging_header(namespace, swift_bridging_path):
             % (name,)
         )
 
-    for name in namespace.swift_class_names:
+    for name in sorted(set(namespace.swift_class_names)):
         output.append(
             """
 @interface %s : NSObject
@@ -137,7 +472,7 @@ def generate_swift_bridging_header(namespace, swift_bridging_path):
 
     output = "\n".join(output).strip()
     if len(output) < 1:
-        return
+        return False
 
     header = """//
 // Copyright 2022 Signal Messenger, LLC
@@ -167,35 +502,218 @@ def generate_swift_bridging_header(namespace, swift_bridging_path):
     if not os.path.exists(parent_dir_path):
         os.makedirs(parent_dir_path)
 
-    print("Writing:", swift_bridging_path)
-    with open(swift_bridging_path, "wt") as f:
-        f.write(output)
+    if sds_common.write_text_file_if_changed(swift_bridging_path, output):
+        print("Writing:", swift_bridging_path)
+    return True
 
 
-# ---
+# Removes everything in the bridging dir other than the headers that were
+# just generated.
+def remove_stale_bridging_headers(swift_bridging_path, bridging_header_paths):
+    for rootdir, dirnames, filenames in os.walk(swift_bridging_path, topdown=False):
+        for filename in filenames:
+            file_path = os.path.abspath(os.path.join(rootdir, filename))
+            if file_path not in bridging_header_paths:
+                print("Removing:", file_path)
+                os.remove(file_path)
+        for dirname in dirnames:
+            dir_path = os.path.join(rootdir, dirname)
+            if len(os.listdir(dir_path)) == 0:
+                os.rmdir(dir_path)
 
 
-def process_dir(src_dir_path, dir_name, dst_dir_path):
-    namespace = Namespace()
+# ---
 
-    dir_path = os.path.abspath(os.path.join(src_dir_path, dir_name))
 
-    file_paths = []
-    for rootdir, dirnames, filenames in os.walk(dir_path):
+# Returns a map of module name => the paths of the files in the module's
+# dir, in os.walk() order. The source tree is walked once for all modules,
+# skipping dirs that don't contain any module.
+def find_module_file_paths(src_dir_path, module_dir_paths):
+    dir_module_names = {
+        dir_path: module_name for module_name, dir_path in module_dir_paths.items()
+    }
+    ancestor_dir_paths = set()
+    for dir_path in module_dir_paths.values():
+        while dir_path != src_dir_path and dir_path.startswith(src_dir_path):
+            dir_path = os.path.dirname(dir_path)
+            ancestor_dir_paths.add(dir_path)
+
+    module_file_paths = {module_name: [] for module_name in module_dir_paths}
+    # The module of each dir that's about to be walked; a dir in a module
+    # belongs to the innermost one.
+    walk_module_names = {src_dir_path: dir_module_names.get(src_dir_path)}
+    for rootdir, dirnames, filenames in os.walk(src_dir_path):
+        module_name = walk_module_names.pop(rootdir)
+        walk_dirnames = []
+        for dirname in dirnames:
+            dir_path = os.path.join(rootdir, dirname)
+            dir_module_name = dir_module_names.get(dir_path, module_name)
+            if dir_module_name is None and dir_path not in ancestor_dir_paths:
+                continue
+            walk_module_names[dir_path] = dir_module_name
+            walk_dirnames.append(dirname)
+        dirnames[:] = walk_dirnames
+
+        if module_name is None:
+            continue
         for filename in filenames:
             file_path = os.path.abspath(os.path.join(rootdir, filename))
-            file_paths.append(file_path)
+            module_file_paths[module_name].append(file_path)
+    return module_file_paths
+
 
-    print(f"Found {len(file_paths)} files in {dir_path}")
-    for idx, file_path in enumerate(file_paths):
-        process_file(file_path, namespace)
-        if idx % 100 == 99:
-            print(f"... {idx+1} / {len(file_paths)}")
+# Generates a bridging header for each module. The files of every module
+# are processed by one shared pool. Returns the paths of the headers.
+def process_modules(
+    src_dir_path, module_dir_paths, dst_dir_path, backend, jobs, cache, timing
+):
+    with timing.stage("find files"):
+        module_file_paths = find_module_file_paths(src_dir_path, module_dir_paths)
 
-    bridging_header_path = os.path.abspath(
-        os.path.join(dst_dir_path, dir_name, dir_name + "-Swift.h")
+    file_paths = []
+    # The module of each file in file_paths.
+    file_module_names = []
+    for module_name, module_dir_path in module_dir_paths.items():
+        module_file_count = len(module_file_paths[module_name])
+        print(f"Found {module_file_count} files in {module_dir_path}")
+        for file_path in module_file_paths[module_name]:
+            if should_process_file(file_path):
+                file_paths.append(file_path)
+                file_module_names.append(module_name)
+
+    # The declarations of each file, in file order; None until processed.
+    file_namespaces = [None] * len(file_paths)
+    if cache is not None:
+        with timing.stage("cache lookup"):
+            for idx, file_path in enumerate(file_paths):
+                file_namespace = cache.get(file_path)
+                file_namespaces[idx] = file_namespace
+                if timing.enabled and file_namespace is not None:
+                    add_file_metrics(
+                        timing, file_path, file_namespace, {"cache_hit_count": 1}
+                    )
+        hit_count = len(file_paths) - file_namespaces.count(None)
+        print(f"Reusing cached declarations for {hit_count} / {len(file_paths)} files")
+
+    missing_indices = [
+        idx
+        for idx, file_namespace in enumerate(file_namespaces)
+        if file_namespace is None
+    ]
+
+    def did_process_file(count, idx, result):
+        file_namespace, metrics = result
+        file_namespaces[idx] = file_namespace
+        if cache is not None:
+            cache.set(file_paths[idx], file_namespace)
+        if timing.enabled:
+            add_file_metrics(timing, file_paths[idx], file_namespace, metrics)
+        if count % 100 == 99:
+            print(f"... {count+1} / {len(missing_indices)}")
+
+    with timing.stage("parse"):
+        if jobs <= 1:
+            for count, idx in enumerate(missing_indices):
+                did_process_file(count, idx, process_file(file_paths[idx], backend))
+        else:
+            # Files are processed concurrently, but their declarations are
+            # merged into the namespace in file order, so that the bridging
+            # header is identical to that of a serial run.
+            with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+                results = executor.map(
+                    functools.partial(process_file, backend=backend),
+                    [file_paths[idx] for idx in missing_indices],
+                )
+                for count, (idx, result) in enumerate(zip(missing_indices, results)):
+                    did_process_file(count, idx, result)
+
+    if cache is not None:
+        cache.save()
+
+    namespaces = {module_name: Namespace() for module_name in module_dir_paths}
+    for module_name, file_namespace in zip(file_module_names, file_namespaces):
+        namespace = namespaces[module_name]
+        namespace.swift_protocol_names.extend(file_namespace.swift_protocol_names)
+        namespace.swift_class_names.extend(file_namespace.swift_class_names)
+
+    bridging_header_paths = []
+    with timing.stage("write bridging headers"):
+        for module_name, namespace in namespaces.items():
+            bridging_header_path = os.path.abspath(
+                os.path.join(dst_dir_path, module_name, module_name + "-Swift.h")
+            )
+            if generate_swift_bridging_header(namespace, bridging_header_path):
+                bridging_header_paths.append(bridging_header_path)
+    return bridging_header_paths
+
+
+# Returns a map of module name => dir path for the modules to process.
+# Modules are named after their dirs.
+def find_module_dir_paths(src_dir_path, module_paths, should_include_pods):
+    module_dir_paths = {}
+
+    def add_module(dir_path):
+        module_name = os.path.basename(dir_path)
+        if module_name in module_dir_paths:
+            fail("Duplicate module:", module_name)
+        module_dir_paths[module_name] = dir_path
+
+    for module_path in module_paths:
+        dir_path = os.path.abspath(os.path.join(src_dir_path, module_path))
+        if not os.path.isdir(dir_path):
+            fail("Missing module dir:", dir_path)
+        if not dir_path.startswith(os.path.join(src_dir_path, "")):
+            fail("Module dir is outside the src path:", dir_path)
+        add_module(dir_path)
+
+    if should_include_pods:
+        pods_dir_path = os.path.join(src_dir_path, "Pods")
+        with os.scandir(pods_dir_path) as entries:
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                if entry.is_dir() and not entry.name.startswith("."):
+                    add_module(entry.path)
+
+    return module_dir_paths
+
+
+def add_file_metrics(timing, file_path, file_namespace, metrics):
+    metrics["class_count"] = len(file_namespace.swift_class_names)
+    metrics["protocol_count"] = len(file_namespace.swift_protocol_names)
+    timing.add_file_metrics(file_path, metrics)
+
+
+def generate_bridging_headers(
+    src_dir_path,
+    module_paths,
+    should_include_pods,
+    swift_bridging_path,
+    backend,
+    jobs,
+    cache_dir_path,
+    timing,
+):
+    src_dir_path = os.path.abspath(src_dir_path)
+    swift_bridging_path = os.path.abspath(swift_bridging_path)
+
+    cache = None
+    if cache_dir_path is not None:
+        cache_dir_path = os.path.abspath(cache_dir_path)
+        os.makedirs(cache_dir_path, exist_ok=True)
+        cache = SwiftDeclarationCache(cache_dir_path, backend)
+
+    module_dir_paths = find_module_dir_paths(
+        src_dir_path, module_paths, should_include_pods
+    )
+    bridging_header_paths = process_modules(
+        src_dir_path,
+        module_dir_paths,
+        swift_bridging_path,
+        backend,
+        jobs,
+        cache,
+        timing,
     )
-    generate_swift_bridging_header(namespace, bridging_header_path)
+    remove_stale_bridging_headers(swift_bridging_path, bridging_header_paths)
 
 
 # ---
@@ -211,12 +729,57 @@ if __name__ == "__main__":
         required=True,
         help="used to specify a path to process.",
     )
+    parser.add_argument(
+        "--modules",
+        nargs="+",
+        default=["SignalServiceKit"],
+        help="paths of the module dirs to process, relative to the src path. Each gets a bridging header named after its dir.",
+    )
+    parser.add_argument(
+        "--pods",
+        action="store_true",
+        help="also process each pod in the Pods dir as a module.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=swift_backends,
+        default="sourcekitten",
+        help="how to find Swift declarations: with sourcekitten, or with a built-in scanner that only uses sourcekitten for files it can't scan.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of sourcekitten processes to run in parallel.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="path of a directory in which to cache the declarations of each file across runs.",
+    )
+    parser.add_argument(
+        "--repo-root",
+        help="path of the repo's root dir. By default, it's found from the current dir.",
+    )
+    parser.add_argument(
+        "--timing-report",
+        help="path of a JSON file in which to record per-file and per-stage timings.",
+    )
     args = parser.parse_args()
 
-    src_dir_path = os.path.abspath(args.src_path)
-    swift_bridging_path = os.path.abspath(args.swift_bridging_path)
+    if args.repo_root is not None:
+        sds_common.set_repo_root(args.repo_root)
 
-    if os.path.exists(swift_bridging_path):
-        shutil.rmtree(swift_bridging_path)
+    timing = sds_common.TimingReport("sds_parse_swift_bridging", args.timing_report)
+
+    generate_bridging_headers(
+        args.src_path,
+        args.modules,
+        args.pods,
+        args.swift_bridging_path,
+        args.backend,
+        args.jobs,
+        args.cache_dir,
+        timing,
+    )
 
-    process_dir(src_dir_path, "SignalServiceKit", swift_bridging_path)
+    timing.finish()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+import argparse
+import sds_common
+import sds_generate
+import sds_parse_objc
+import sds_parse_swift_bridging
+
+# Runs every step of SDS code generation in one process:
+#
+# 1. sds_parse_swift_bridging.py generates fake -Swift.h bridging headers.
+# 2. sds_parse_objc.py parses the Obj-C model classes with clang.
+# 3. sds_generate.py generates the Swift extensions for the models.
+#
+# The parsed classes are handed straight to the generator, rather than
+# being written to a .sdsjson file alongside each .m file and found again
+# by walking the whole repo. Pass --write-sdsjson to write them anyway,
+# e.g. to debug the parser or to run sds_generate.py on its own.
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run SDS code generation.")
+    parser.add_argument(
+        "--src-path",
+        required=True,
+        help="path of the Obj-C source files to parse.",
+    )
+    parser.add_argument(
+        "--swift-src-path",
+        required=True,
+        help="path of the Swift source files to generate bridging headers for.",
+    )
+    parser.add_argument(
+        "--swift-bridging-path",
+        required=True,
+        help="path of the dir in which to generate bridging headers.",
+    )
+    parser.add_argument(
+        "--skip-swift-bridging",
+        action="store_true",
+        help="reuse the existing bridging headers rather than generating them.",
+    )
+    parser.add_argument(
+        "--modules",
+        nargs="+",
+        default=["SignalServiceKit"],
+        help="paths of the module dirs to generate bridging headers for, relative to the Swift src path.",
+    )
+    parser.add_argument(
+        "--pods",
+        action="store_true",
+        help="also generate bridging headers for each pod in the Pods dir.",
+    )
+    parser.add_argument(
+        "--swift-backend",
+        choices=sds_parse_swift_bridging.swift_backends,
+        default="sourcekitten",
+        help="how to find Swift declarations. See sds_parse_swift_bridging.py.",
+    )
+    parser.add_argument(
+        "--objc-backend",
+        choices=sds_parse_objc.objc_backends,
+        default="text",
+        help="how to parse Obj-C files. See sds_parse_objc.py.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of files to parse, and models to generate, in parallel.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="path of a directory in which to cache parse results across runs.",
+    )
+    parser.add_argument(
+        "--no-pch",
+        action="store_true",
+        help="include prefix headers in each file rather than precompiling them.",
+    )
+    parser.add_argument(
+        "--header-map",
+        action="store_true",
+        help="pass clang a header map rather than an -I flag for every directory with headers.",
+    )
+    parser.add_argument(
+        "--no-prefilter",
+        action="store_true",
+        help="parse every file, even those that can't contain SDS models.",
+    )
+    parser.add_argument(
+        "--write-sdsjson",
+        action="store_true",
+        help="also write the parsed classes of each .m file to a .sdsjson file.",
+    )
+    parser.add_argument(
+        "--record-type-swift-path",
+        required=True,
+        help="path of the record type enum swift file.",
+    )
+    parser.add_argument(
+        "--record-type-json-path",
+        required=True,
+        help="path of the record type map json file.",
+    )
+    parser.add_argument(
+        "--config-json-path",
+        required=True,
+        help="path of the json file with code generation config info.",
+    )
+    parser.add_argument(
+        "--property-order-json-path",
+        required=True,
+        help="path of the json file with property ordering cache.",
+    )
+    parser.add_argument(
+        "--repo-root",
+        help="path of the repo's root dir. By default, it's found from the current dir.",
+    )
+    parser.add_argument(
+        "--timing-report",
+        help="path of a JSON file in which to record per-file and per-stage timings.",
+    )
+    args = parser.parse_args()
+
+    if args.repo_root is not None:
+        sds_common.set_repo_root(args.repo_root)
+
+    timing = sds_common.TimingReport("sds_pipeline", args.timing_report)
+    sds_generate.timing = timing
+
+    if not args.skip_swift_bridging:
+        with timing.stage("swift bridging"):
+            sds_parse_swift_bridging.generate_bridging_headers(
+                args.swift_src_path,
+                args.modules,
+                args.pods,
+                args.swift_bridging_path,
+                args.swift_backend,
+                args.jobs,
+                args.cache_dir,
+                timing,
+            )
+
+    with timing.stage("parse objc"):
+        class_dicts = sds_parse_objc.parse_objc_files(
+            args.src_path,
+            args.swift_bridging_path,
+            args.jobs,
+            args.cache_dir,
+            args.objc_backend,
+            not args.no_pch,
+            args.header_map,
+            not args.no_prefilter,
+            args.write_sdsjson,
+            timing,
+        )
+
+    with timing.stage("generate"):
+        sds_generate.generate(
+            None,
+            None,
+            None,
+            (class_dicts, sds_parse_objc.enum_type_map),
+            args.jobs,
+            args.record_type_swift_path,
+            args.record_type_json_path,
+            args.config_json_path,
+            args.property_order_json_path,
+        )
+
+    timing.finish()
@@ -3,9 +3,14 @@
 set -eux
 
 # We generate Swift extensions to handle serialization, etc. for models.
+#
+# This reads the .sdsjson files written by sds_parse_objc.py (or by
+# `sds_codegen.sh --write-sdsjson`); sds_codegen.sh doesn't keep them.
+# They're found with the manifest in the cache dir, or failing that, by
+# searching the repo.
 RECORD_TYPE_SWIFT="SignalServiceKit/Storage/Database/SDSRecordType.swift"
 RECORD_TYPE_JSON="Scripts/sds_codegen/sds_config/sds_record_type_map.json"
 CONFIG_JSON="Scripts/sds_codegen/sds_config/sds-config.json"
 PROPERTY_ORDER_JSON="Scripts/sds_codegen/sds_config/sds-property_order.json"
 GENERATE_ARGS="--record-type-swift-path $RECORD_TYPE_SWIFT  --record-type-json-path $RECORD_TYPE_JSON --config-json-path $CONFIG_JSON --property-order-json-path $PROPERTY_ORDER_JSON"
-Scripts/sds_codegen/sds_generate.py  --src-path SignalServiceKit/  --search-path .  $GENERATE_ARGS
+Scripts/sds_codegen/sds_generate.py  --src-path SignalServiceKit/  --search-path .  --cache-dir Scripts/sds_codegen/sds-cache  --jobs `sysctl -n hw.ncpu`  $GENERATE_ARGS ${SDS_TIMING_REPORT_DIR:+--timing-report $SDS_TIMING_REPORT_DIR/sds_generate.json}